@@ -2,7 +2,6 @@ from machine import Pin, SPI
 import time
 import framebuf
 from array import array
-from math import ceil, log2, floor
 
 ST7735_NOP          = const(b'\x00')
 ST7735_SWRESET      = const(b'\x01')
@@ -25,6 +24,8 @@ ST7735_VSCRDEF      = const(b'\x33')
 ST7735_COLMOD       = const(b'\x3A')
 ST7735_MADCTL       = const(b'\x36')
 ST7735_VSCRSADD     = const(b'\x37')
+ST7735_IDMOFF       = const(b'\x38')
+ST7735_IDMON        = const(b'\x39')
 ST7735_FRMCTR1      = const(b'\xB1')
 ST7735_FRMCTR2      = const(b'\xB2')
 ST7735_FRMCTR3      = const(b'\xB3')
@@ -44,6 +45,11 @@ ST7735_PWCTR6       = const(b'\xFC')
 ST7735_GMCTRP1      = const(b'\xE0')
 ST7735_GMCTRN1      = const(b'\xE1')
 
+# Rows of frame memory the panel scans, which the scroll areas set with VSCRDEF must add up to
+FRAME_ROWS = const(162)
+# Time the panel needs after SLPIN or SLPOUT before the next sleep command, in ms
+SLEEP_DELAY_MS = const(120)
+
 init_cmds = [
     # SLPOUT - Sleep out & booster on
     [ST7735_SLPOUT],
@@ -103,6 +109,11 @@ init_cmds = [
 bitmask = const((128, 64, 32, 16, 8, 4, 2, 1))
 bitmask_inv = const((127, 191, 223, 239, 247, 251, 253, 254))
 
+# Bytes sent to open a window write: CASET and RASET with 4 argument bytes each, plus RAMWR
+WINDOW_COST = const(11)
+# Bytes saved when CASET or RASET is skipped because its range is already programmed
+AXIS_COST = const(5)
+
 def rgb_to_565(rgb):
     r, g, b = rgb
     # Convert RGB values to 5-6-5 format
@@ -115,7 +126,17 @@ class Renderer:
     def draw_rect(self, x, y, w, h, fill, thickness):
         raise NotImplementedError()
 
-    def draw_text(self, text, x, y):
+    # Rects for text with its top left at x, y, each font pixel drawn as a scale x scale square
+    def draw_text(self, text, x, y, font=None, scale=1):
+        raise NotImplementedError()
+
+    # Width and height of a string in pixels
+    def text_size(self, text, font=None):
+        raise NotImplementedError()
+
+    # Rasterize a string into a MONO_HLSB bitmap with its top left at 0, 0.
+    # Returns (buffer, stride in bytes).
+    def text_bitmap(self, text, font=None):
         raise NotImplementedError()
 
     def draw_hline(self, x, y, w):
@@ -133,61 +154,128 @@ class Renderer:
     def draw_ellipse(self, x, y, rx, ry, fill):
         raise NotImplementedError()
 
+    # Fill a list of (points, closed) polygons, points as [x0, y0, x1, y1, ...], with the even-odd
+    # rule so polygons inside others cut holes
+    def draw_polygons(self, polygons):
+        raise NotImplementedError()
+
+    # Outline a list of (points, closed) polylines, closing those marked closed
+    def draw_polylines(self, polylines):
+        raise NotImplementedError()
+
     def draw_svg(self, svg):
         raise NotImplementedError()
 
+    def draw_svg_shape(self, shape):
+        raise NotImplementedError()
+
+    # Called when the width and height of the display swap after a rotation
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+
+    # Retained renderers composite draws off-screen. The driver hands them the rects and colour of
+    # each draw through add_rects instead of sending them, and show() calls flush to update the panel.
+    retained = False
+
+    def add_rects(self, data, c: bytes):
+        raise NotImplementedError()
+
+    def flush(self, tft):
+        raise NotImplementedError()
+
+# Runs of set pixels in each possible byte of a MONO_HLSB buffer, as bytes of (start, end) bit pairs
+# with bit 7 (the leftmost pixel) as position 0
+def _build_byte_runs():
+    runs = []
+    for b in range(256):
+        byte_runs = bytearray()
+        start = -1
+        for i in range(8):
+            if b & bitmask[i]:
+                if start < 0:
+                    start = i
+            elif start >= 0:
+                byte_runs.extend((start, i - 1))
+                start = -1
+        if start >= 0:
+            byte_runs.extend((start, 7))
+        runs.append(bytes(byte_runs))
+    return tuple(runs)
+
+byte_runs = _build_byte_runs()
+
 # A mono-only frame buffer built for fast pixel yields
 class MonoFrameBuffer(framebuf.FrameBuffer):
     def __init__(self, width: int, height: int):
         self.width = width
-        self.draw_buf_size = ceil((width * height) / 8)
+        self.height = height
+        # Each row starts on a byte boundary
+        self.stride = (width + 7) >> 3
+        self.draw_buf_size = self.stride * height
         
-        self.draw_buf = bytearray(self.draw_buf_size * [0x00])
+        self.draw_buf = bytearray(self.draw_buf_size)
         self.draw_buf_ref = memoryview(self.draw_buf)
         super().__init__(self.draw_buf_ref, width, height, framebuf.MONO_HLSB)
 
     def px_in_row(self, y, start_x, end_x):
-        buf = self.draw_buf_ref
-        buf_width = self.width
-        bottom_pos = y * buf_width + start_x
-        top_pos = bottom_pos + end_x
-        start_byte = floor(bottom_pos / 8)
-        pos = start_byte * 8
-
-        for b in buf[start_byte:ceil(top_pos / 8) + 1]:
-            while b > 0:
-                bitlen = 7 - int(log2(b))
-                b = b & bitmask_inv[bitlen]
-                new_pos = pos + bitlen
-                if new_pos < bottom_pos:
-                    continue
-                elif new_pos > top_pos:
-                    return
-                # Yield the x
-                yield new_pos % buf_width
-            pos += 8
+        for line_start_x, line_end_x in self.lines_in_row(y, start_x, end_x):
+            for x in range(line_start_x, line_end_x + 1):
+                yield x
 
+    # Yield (start_x, end_x) for each run of set pixels in row y between start_x and end_x, inclusive.
+    # Works a byte at a time: empty and full bytes are skipped or absorbed whole, and the runs in any
+    # other byte come from the byte_runs table.
     def lines_in_row(self, y, start_x=0, end_x=None):
-        end_x = self.width if None else end_x
-        next_x = start_x
-        line_width = 0
-        for px in self.px_in_row(y, start_x, end_x):
-            if px == next_x:
-                line_width += 1
-                next_x += 1
+        if y < 0 or y >= self.height:
+            return
+        end_x = self.width - 1 if end_x is None else min(end_x, self.width - 1)
+        start_x = max(start_x, 0)
+        if start_x > end_x:
+            return
+        buf = self.draw_buf
+        runs_table = byte_runs
+        row = y * self.stride
+        first = start_x >> 3
+        last = end_x >> 3
+        first_mask = 0xFF >> (start_x & 7)
+        last_mask = (0xFF00 >> ((end_x & 7) + 1)) & 0xFF
+        run_start = -1
+
+        for i in range(first, last + 1):
+            b = buf[row + i]
+            if i == first:
+                b &= first_mask
+            if i == last:
+                b &= last_mask
+            base = i << 3
+            if b == 0:
+                if run_start >= 0:
+                    yield run_start, base - 1
+                    run_start = -1
+                continue
+            if b == 0xFF:
+                if run_start < 0:
+                    run_start = base
                 continue
-            elif line_width > 0:
-                yield next_x - line_width, next_x - 1
-            next_x = px + 1
-            line_width = 1
-        if line_width > 0:
-            yield next_x - line_width, next_x - 1
+            runs = runs_table[b]
+            for k in range(0, len(runs), 2):
+                if run_start < 0:
+                    run_start = base + runs[k]
+                elif runs[k] != 0:
+                    # The run carried over from the previous byte ended on the byte boundary
+                    yield run_start, base - 1
+                    run_start = base + runs[k]
+                if runs[k + 1] != 7:
+                    yield run_start, base + runs[k + 1]
+                    run_start = -1
+        if run_start >= 0:
+            yield run_start, (last << 3) + 7
 
     def set_px(self, x, y, p):
         buf = self.draw_buf_ref
-        pos = (y * self.width) + x
-        mod = pos % 8
-        pos = int((pos - mod) / 8)
+        pos = y * self.stride + (x >> 3)
+        mod = x & 7
         if p == 0:
             buf[pos] = buf[pos] & bitmask_inv[mod]
         else:
@@ -214,68 +302,305 @@ class Rect(bytearray):
         return self[3]
         
         
+# Merge runs of pixels into rects. rows is a list of runs per row, each run a (start, end) pair,
+# with the first row at first_row. A rect is extended down while the next row has a run with the
+# same span. When the next row's run is wider and contains open rects, those carry on down and the
+# gaps between them start new rects, as long as there are no more than max_gaps gaps; otherwise the
+# run starts a rect of its own. Finally, rects side by side covering the same rows are joined.
+# Returns [x, y, w, h, ...] bytes.
+def merge_runs(rows, first_row=0, max_gaps=255):
+    rects = []
+    # Open rects by span, as [x, y, w, h]
+    active = {}
+    for y, runs in enumerate(rows, first_row):
+        next_active = {}
+        for start, end in runs:
+            span = (start, end)
+            rect = active.pop(span, None)
+            if rect is not None:
+                rect[3] += 1
+                next_active[span] = rect
+                continue
+
+            # Open rects lying within the run can carry on down, with new rects for the gaps
+            inside = sorted(open_span for open_span in active if open_span[0] >= start and open_span[1] <= end)
+            gaps = []
+            pos = start
+            for open_span in inside:
+                if open_span[0] > pos:
+                    gaps.append((pos, open_span[0] - 1))
+                pos = open_span[1] + 1
+            if pos <= end:
+                gaps.append((pos, end))
+            if inside and len(gaps) <= max_gaps:
+                for open_span in inside:
+                    rect = active.pop(open_span)
+                    rect[3] += 1
+                    next_active[open_span] = rect
+                for gap in gaps:
+                    next_active[gap] = [gap[0], y, gap[1] - gap[0] + 1, 1]
+            else:
+                next_active[span] = [start, y, end - start + 1, 1]
+        rects.extend(active.values())
+        active = next_active
+    rects.extend(active.values())
+
+    # Join neighbours covering the same rows
+    rects.sort(key=lambda r: (r[1], r[3], r[0]))
+    merged = bytearray()
+    last = None
+    for rect in rects:
+        if last is not None and last[1] == rect[1] and last[3] == rect[3] and last[0] + last[2] == rect[0]:
+            last[2] += rect[2]
+            continue
+        if last is not None:
+            merged.extend(last)
+        last = rect
+    if last is not None:
+        merged.extend(last)
+    return merged
+
+# Bytes a rect list costs on the wire in command overhead, given the driver skips CASET or RASET when
+# a rect has the same columns or rows as the one before it. Pixel bytes aren't included as they are
+# the same for any decomposition of the same pixels.
+def rects_cost(rects):
+    cost = 0
+    last_cols = None
+    last_rows = None
+    for i in range(0, len(rects), 4):
+        cols = (rects[i], rects[i + 2])
+        rows = (rects[i + 1], rects[i + 3])
+        cost += WINDOW_COST
+        if cols == last_cols:
+            cost -= AXIS_COST
+        if rows == last_rows:
+            cost -= AXIS_COST
+        last_cols = cols
+        last_rows = rows
+    return cost
+
+# Copy of a rect list moved by dx, dy and clipped to a width x height screen. Rects moved entirely
+# off the screen are dropped.
+def translate_rects(rects, dx, dy, width, height):
+    moved = bytearray()
+    for i in range(0, len(rects), 4):
+        x = rects[i] + dx
+        y = rects[i + 1] + dy
+        right = min(x + rects[i + 2], width)
+        bottom = min(y + rects[i + 3], height)
+        x = max(x, 0)
+        y = max(y, 0)
+        if right > x and bottom > y:
+            moved.extend((x, y, right - x, bottom - y))
+    return moved
+
+# Bytes to send a region of the screen, bottom right exclusive, in one window write
+def region_cost(x0, y0, x1, y1):
+    return (x1 - x0) * (y1 - y0) * 2 + WINDOW_COST
+
+# Add a region [x0, y0, x1, y1] (bottom right exclusive) to a list of regions, merging it with
+# existing regions whenever sending the union is no more expensive than sending both, and merging
+# the cheapest pair while there are more than max_regions
+def add_region(regions, x0, y0, x1, y1, max_regions):
+    if x1 <= x0 or y1 <= y0:
+        return
+    cost = region_cost
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            d = regions[i]
+            u = (min(x0, d[0]), min(y0, d[1]), max(x1, d[2]), max(y1, d[3]))
+            if cost(*u) <= cost(x0, y0, x1, y1) + cost(*d):
+                x0, y0, x1, y1 = u
+                regions.pop(i)
+                merged = True
+                break
+    regions.append([x0, y0, x1, y1])
+
+    while len(regions) > max_regions:
+        best = None
+        for i in range(len(regions)):
+            a = regions[i]
+            for j in range(i + 1, len(regions)):
+                b = regions[j]
+                u = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                extra = cost(*u) - cost(*a) - cost(*b)
+                if best is None or extra < best[0]:
+                    best = (extra, i, j, u)
+        _, i, j, u = best
+        regions.pop(j)
+        regions[i] = list(u)
+
+# The parts of a rect list inside the region [x0, y0, x1, y1], bottom right exclusive
+def clip_rects(rects, x0, y0, x1, y1):
+    clipped = bytearray()
+    for i in range(0, len(rects), 4):
+        x = rects[i]
+        y = rects[i + 1]
+        right = min(x + rects[i + 2], x1)
+        bottom = min(y + rects[i + 3], y1)
+        x = max(x, x0)
+        y = max(y, y0)
+        if right > x and bottom > y:
+            clipped.extend((x, y, right - x, bottom - y))
+    return clipped
+
+# Header of font cache files written by MonoFrameBufRenderer.save_font_cache
+FONT_CACHE_MAGIC = const(b'STFC')
+
 class MonoFrameBufRenderer(Renderer):
-    def __init__(self, width, height, cache_font) -> None:
+    # font_cache_file is where the font cache is persisted. It is loaded from there if present, or
+    # built and saved there on first boot. It can also be a module generated by save_font_cache,
+    # e.g. one frozen into the firmware, to use the cache straight from flash.
+    def __init__(self, width, height, cache_font, font_cache_file=None) -> None:
         self.width = width
         self.height = height
         self.mono_fb = MonoFrameBuffer(self.width, self.height)
 
-        self.font_cache : bytearray
-        self.font_cache_lookup : array
+        self.font_cache : bytearray | None = None
+        self.font_cache_lookup : array | None = None
+        # Copies of the font cache with the rects already scaled, by scale. See build_scaled_font_cache.
+        self.scaled_font_caches = {}
         if cache_font:
             self.font_cache_lookup = array("h", 127 * [0])
-            self.build_font_cache()
-
-    # Helper function for checking if a line of pixels can extend down one level
-    def can_expand_line_down(self, start_x, end_x, y):
-        for line_start_x,line_end_x in self.mono_fb.lines_in_row(y, start_x, end_x):
-            return line_start_x == start_x and line_end_x == end_x
-
-    def get_expanded_rect(self, start_x, end_x, y) -> Rect:
-        can_expand_down = self.can_expand_line_down
-        h = 1
-        next_row = y + 1
-        while can_expand_down(start_x, end_x, next_row):
-            # If it did expand down, unset the pixels expanded
-            for exp_x in range(start_x, end_x + 1):
-                self.mono_fb.set_px(exp_x, next_row, 0)
-            next_row += 1
-            h += 1
-        return Rect(start_x, y, end_x - start_x + 1, h)
+            if font_cache_file is None:
+                self.build_font_cache()
+            elif isinstance(font_cache_file, str):
+                try:
+                    self.load_font_cache(font_cache_file)
+                except (OSError, ValueError):
+                    self.build_font_cache()
+                    self.save_font_cache(font_cache_file)
+            else:
+                self.load_font_cache_module(font_cache_file)
+
+    def resize(self, width, height):
+        if width != self.width or height != self.height:
+            self.width = width
+            self.height = height
+            self.mono_fb = MonoFrameBuffer(width, height)
 
     # Compose the pixels in the framebuffer into rectangles. Used for faster drawing.
     # Return format is a list of bytes in the format [rect1_x, rect1_y, rect1_w, rect1_h, rect2_x...]
-    def find_rects_in_fb(self, start_x, end_x, start_y, end_y):
-        get_expanded_rect = self.get_expanded_rect
-        rects = bytearray()
-        # For each row and column
-        for y in range(start_y,end_y+1):
-            for line_start_x,line_end_x in self.mono_fb.lines_in_row(y, start_x, end_x):
-                rects.extend(get_expanded_rect(line_start_x, line_end_x, y))
-        return rects
+    # The runs are merged both greedily and only on exact matches, row-first and, with try_columns,
+    # column-first as well. Whichever decomposition costs the fewest bytes on the wire is returned.
+    def find_rects_in_fb(self, start_x, end_x, start_y, end_y, try_columns=True):
+        lines_in_row = self.mono_fb.lines_in_row
+        rows = [list(lines_in_row(y, start_x, end_x)) for y in range(start_y, end_y + 1)]
+        best = merge_runs(rows, start_y)
+        best_cost = rects_cost(best)
+        candidates = [(rows, start_y, False)]
+        if try_columns:
+            # Transpose the row runs into runs down each column
+            columns = [[] for _ in range(start_x, end_x + 1)]
+            for y, runs in enumerate(rows, start_y):
+                for line_start_x, line_end_x in runs:
+                    for x in range(line_start_x - start_x, line_end_x - start_x + 1):
+                        column = columns[x]
+                        if column and column[-1][1] == y - 1:
+                            column[-1][1] = y
+                        else:
+                            column.append([y, y])
+            candidates.append((columns, start_x, True))
+
+        for runs, first, transposed in candidates:
+            for max_gaps in ((255, 0) if transposed else (0,)):
+                rects = merge_runs(runs, first, max_gaps)
+                if transposed:
+                    # Swap the axes back
+                    for i in range(0, len(rects), 4):
+                        rects[i], rects[i + 1] = rects[i + 1], rects[i]
+                        rects[i + 2], rects[i + 3] = rects[i + 3], rects[i + 2]
+                cost = rects_cost(rects)
+                if cost < best_cost:
+                    best = rects
+                    best_cost = cost
+        return best
         
     # Draw each ASCII characters 33-126, decompose the characters into rectangles, and cache them for faster drawing
     def build_font_cache(self):
+        lookup = self.font_cache_lookup
+        glyphs = []
         font_cache_pos = 0
-        font_cache = bytearray()
 
         for c in range(127):
             if c < 33:
-                self.font_cache_lookup[c] = -1
+                lookup[c] = -1
                 continue
             # Get the frame buffer to draw the character
             self.mono_fb.fill_rect(0, 0, 8, 8, 0)
             self.mono_fb.text(chr(c), 0, 0, 1)
 
             char_rects = self.find_rects_in_fb(0, 7, 0, 7)
+            glyphs.append(char_rects)
+            lookup[c] = font_cache_pos
+            font_cache_pos += len(char_rects) + 1
 
-            self.font_cache_lookup[c] = font_cache_pos
+        # Copy the glyphs into a single buffer of the final size
+        font_cache = bytearray(font_cache_pos)
+        font_cache_pos = 0
+        for char_rects in glyphs:
             len_char_rects = len(char_rects)
+            font_cache[font_cache_pos] = len_char_rects // 4
+            font_cache[font_cache_pos + 1:font_cache_pos + 1 + len_char_rects] = char_rects
             font_cache_pos += len_char_rects + 1
-            font_cache += int(len_char_rects / 4).to_bytes(1, 'big')
-            font_cache += char_rects
-            
         self.font_cache = font_cache
+        self.scaled_font_caches = {}
+
+    # Keep a copy of the font cache with every rect multiplied by scale, so text at that scale is
+    # drawn without scaling each rect as it is copied. It is the same size as the font cache and
+    # shares its lookup.
+    def build_scaled_font_cache(self, scale):
+        font_cache = self.font_cache
+        lookup = self.font_cache_lookup
+        scaled = bytearray(font_cache)
+        for c in range(len(lookup)):
+            pos = lookup[c]
+            if pos < 0:
+                continue
+            for i in range(pos + 1, pos + 1 + 4 * font_cache[pos]):
+                scaled[i] = font_cache[i] * scale
+        self.scaled_font_caches[scale] = scaled
+
+    # Write the font cache to path. A path ending in .py is written as a module that can be frozen
+    # into the firmware and passed to load_font_cache_module.
+    # The cache depends on the font framebuf.text draws, so generate it with the same firmware (or
+    # a host font that matches it) as the device that will load it.
+    def save_font_cache(self, path):
+        if path.endswith(".py"):
+            with open(path, "w") as f:
+                f.write("# Font cache generated by MonoFrameBufRenderer.save_font_cache\n")
+                f.write("lookup = " + repr(bytes(self.font_cache_lookup)) + "\n")
+                f.write("cache = " + repr(bytes(self.font_cache)) + "\n")
+            return
+        with open(path, "wb") as f:
+            f.write(FONT_CACHE_MAGIC)
+            f.write(len(self.font_cache).to_bytes(2, 'little'))
+            f.write(self.font_cache_lookup)
+            f.write(self.font_cache)
+
+    # Read a font cache written by save_font_cache straight into preallocated buffers
+    def load_font_cache(self, path):
+        with open(path, "rb") as f:
+            header = f.read(6)
+            if len(header) < 6 or header[0:4] != FONT_CACHE_MAGIC:
+                raise ValueError("Not a font cache file")
+            size = int.from_bytes(header[4:6], 'little')
+            lookup = array("h", bytes(2 * 127))
+            font_cache = bytearray(size)
+            if f.readinto(lookup) != 2 * 127 or f.readinto(font_cache) != size:
+                raise ValueError("Truncated font cache file")
+        self.font_cache_lookup = lookup
+        self.font_cache = font_cache
+        self.scaled_font_caches = {}
+
+    # Use a font cache module written by save_font_cache. The glyph rects are used in place, so a
+    # frozen module keeps them in flash.
+    def load_font_cache_module(self, module):
+        self.font_cache_lookup = array("h", module.lookup)
+        self.font_cache = module.cache
+        self.scaled_font_caches = {}
 
     # Draw the pixels in the region defined in the frame buffer
     def draw_fb_pixels(self, start_x, end_x, start_y, end_y, convex=False):
@@ -288,17 +613,20 @@ class MonoFrameBufRenderer(Renderer):
                     break
         return rect_buf
     
+    # The part of a rect inside the bounds, or no rect if it is entirely outside
     @staticmethod
     def cull_rect(x, y, w, h, bound_left, bound_top, bound_right, bound_bottom):
         new_x = max(x, bound_left)
         new_y = max(y, bound_top)
         new_w = min(x + w, bound_right) - new_x
         new_h = min(y + h, bound_bottom) - new_y
+        if new_w <= 0 or new_h <= 0:
+            return bytearray()
         return Rect(new_x, new_y, new_w, new_h)
 
     def draw_rect(self, x, y, w, h, fill=True, thickness=1):
         if fill:
-            return bytearray(Rect(x, y, w, h))
+            return bytearray(self.cull_rect(x, y, w, h, 0, 0, self.width, self.height))
         else:
             # Broken
             half_thick = int(thickness / 2)
@@ -314,37 +642,106 @@ class MonoFrameBufRenderer(Renderer):
                 cull(x + half_thick, y + h - half_thick, w - thickness, thickness, 0, 0, width, height)
             ))
 
-    # Draw text using the font cache
-    def draw_text(self, text: str, x, y):
+    # Append a glyph's rects to rect_buf, scaled and then moved to x, y
+    @staticmethod
+    def place_rects(rect_buf, rects, x, y, scale):
+        start = len(rect_buf)
+        # Copy the rects out before changing them so the cache itself is left untouched
+        rect_buf.extend(rects)
+        if scale == 1:
+            for r in range(start, len(rect_buf), 4):
+                rect_buf[r] += x
+                rect_buf[r + 1] += y
+        else:
+            for r in range(start, len(rect_buf), 4):
+                rect_buf[r] = rect_buf[r] * scale + x
+                rect_buf[r + 1] = rect_buf[r + 1] * scale + y
+                rect_buf[r + 2] *= scale
+                rect_buf[r + 3] *= scale
+
+    # Draw text using the font cache, or with a fonts.BitmapFont if one is given. Scaled text uses
+    # the same rects as unscaled text, just bigger, so it costs the same number of rects.
+    def draw_text(self, text: str, x, y, font=None, scale=1):
+        if font is not None:
+            return self.draw_font_text(text, x, y, font, scale)
         x_pos = x
-        cache_lookup_len = len(self.font_cache_lookup)
+        width = self.width
+        lookup = self.font_cache_lookup
+        cache_lookup_len = 0 if lookup is None else len(lookup)
         rect_buf = bytearray()
-        cache_ref = memoryview(self.font_cache)
+        cache_ref = None
+        rect_scale = scale
+        if lookup is not None:
+            font_cache = self.scaled_font_caches.get(scale) if scale != 1 else None
+            if font_cache is None:
+                font_cache = self.font_cache
+            else:
+                rect_scale = 1
+            cache_ref = memoryview(font_cache)
+        advance = 8 * scale
         mono_fb = self.mono_fb
         
         for symbol in text:
             symbol_ord = ord(symbol)
             if symbol_ord < cache_lookup_len:
                 # Use the lookup to find where the data for this character is in the font cache
-                font_cache_pos = self.font_cache_lookup[symbol_ord]
+                font_cache_pos = lookup[symbol_ord]
                 if font_cache_pos > -1:
                     # The first byte tells you how many rectangles are in this character
                     num_rects = cache_ref[font_cache_pos]
-                    symbol_rects = cache_ref[font_cache_pos + 1:font_cache_pos + 1 + (4 * num_rects)]
-                    for r in range(num_rects):
-                        symbol_rects[r * 4] += x_pos
-                        symbol_rects[r * 4 + 1] += y
-                    rect_buf.extend(symbol_rects)
+                    self.place_rects(rect_buf, cache_ref[font_cache_pos + 1:font_cache_pos + 1 + (4 * num_rects)], x_pos, y, rect_scale)
             else:
-                mono_fb.fill_rect(x, y, 8, 8, 0)
-                mono_fb.text(text, x, y, 1)
-                rect_buf.extend(self.draw_fb_pixels(x, x + 8, y, y + 8))
+                # Not in the font cache, rasterize just this character
+                mono_fb.fill_rect(0, 0, 8, 8, 0)
+                mono_fb.text(symbol, 0, 0, 1)
+                self.place_rects(rect_buf, self.find_rects_in_fb(0, 7, 0, 7, try_columns=False), x_pos, y, scale)
 
-            x_pos += 8
-            if x_pos > self.width:
+            x_pos += advance
+            if x_pos > width:
                 return rect_buf
         return rect_buf
 
+    # Draw text in a fonts.BitmapFont, using its cache of glyph rects
+    def draw_font_text(self, text: str, x, y, font, scale=1):
+        x_pos = x
+        width = self.width
+        rect_buf = bytearray()
+        glyph_rects = font.glyph_rects
+
+        for symbol in text:
+            if x_pos >= width:
+                break
+            char_width, char_rects = glyph_rects(ord(symbol), self)
+            self.place_rects(rect_buf, char_rects, x_pos, y, scale)
+            x_pos += char_width * scale
+        return rect_buf
+
+    def text_size(self, text, font=None):
+        if font is None:
+            return 8 * len(text), 8
+        return font.text_width(text), font.height
+
+    # Rasterize into the scratch framebuffer, clipped to its width
+    def text_bitmap(self, text, font=None):
+        mono_fb = self.mono_fb
+        w, h = self.text_size(text, font)
+        mono_fb.fill_rect(0, 0, w, h, 0)
+        if font is None:
+            mono_fb.text(text, 0, 0, 1)
+        else:
+            x_pos = 0
+            for symbol in text:
+                if x_pos >= self.width:
+                    break
+                glyph = font.glyph_bitmap(ord(symbol))
+                if glyph is None:
+                    continue
+                char_width, data = glyph
+                if char_width > 0:
+                    mono_fb.blit(framebuf.FrameBuffer(bytearray(data), char_width, font.height, framebuf.MONO_HLSB), x_pos, 0)
+                x_pos += char_width
+        return mono_fb.draw_buf_ref, mono_fb.stride
+
     def draw_hline(self, x, y, w):
         return memoryview(Rect(x, y, w, 1))
 
@@ -356,23 +753,25 @@ class MonoFrameBufRenderer(Renderer):
         max_x = max(x1, x2)
         min_y = min(y1, y2)
         max_y = max(y1, y2)
-        self.mono_fb.fill_rect(min_x, min_y, max_x - min_x, max_y - min_y, 0)
+        self.mono_fb.fill_rect(min_x, min_y, max_x - min_x + 1, max_y - min_y + 1, 0)
         self.mono_fb.line(x1, y1, x2, y2, 1)
         return self.draw_fb_pixels(min_x, max_x, min_y, max_y, convex=True)
 
     def draw_poly(self, x, y, coords, fill=True, convex=False):
         coord_array = array("i", coords)
         coord_len = len(coord_array)
-        x_max = max([coord_array[i] for i in range(0, coord_len, 2)])
-        y_max = max([coord_array[i] for i in range(1, coord_len, 2)])
+        x_max = x + max([coord_array[i] for i in range(0, coord_len, 2)])
+        y_max = y + max([coord_array[i] for i in range(1, coord_len, 2)])
         self.mono_fb.fill_rect(x, y, x_max - x + 1, y_max - y + 1, 0)
-        self.mono_fb.poly(x, y, coord_array, fill)
+        self.mono_fb.poly(x, y, coord_array, 1, fill)
+        if fill:
+            return self.find_rects_in_fb(x, x_max, y, y_max, try_columns=False)
         return self.draw_fb_pixels(x, x_max, y, y_max, convex)
 
     def draw_ellipse(self, x, y, rx, ry, fill=True):
         rect_buf = bytearray()
         # Fill the top-left quadrant and use that to draw the whole shape
-        self.mono_fb.fill_rect(x - rx, y - ry, rx, ry, 0)
+        self.mono_fb.fill_rect(x - rx, y - ry, rx + 1, ry, 0)
         self.mono_fb.ellipse(x, y, rx, ry, 1, False, 2)
         # For each row and column
         rect_height = ry * 2 if fill else 1
@@ -394,72 +793,353 @@ class MonoFrameBufRenderer(Renderer):
                 rect_height -= 2
         return rect_buf
 
+    # Bounds of the points of some polylines as (x0, y0, x1, y1) inclusive, clipped to the screen
+    def _points_bounds(self, polylines):
+        x0 = y0 = 0x7FFF
+        x1 = y1 = -0x7FFF
+        for points, _ in polylines:
+            for i in range(0, len(points), 2):
+                x0 = min(x0, points[i])
+                x1 = max(x1, points[i])
+                y0 = min(y0, points[i + 1])
+                y1 = max(y1, points[i + 1])
+        return max(x0, 0), max(y0, 0), min(x1, self.width - 1), min(y1, self.height - 1)
+
+    # Each polygon is filled with framebuf's poly into the scratch buffer on its own and XORed into
+    # the result, which gives the even-odd rule across polygons. poly fills include the outline, so
+    # XORing cancels the edges polygons share; the outlines are drawn back on top afterwards, as
+    # poly would for a single polygon.
+    def draw_polygons(self, polygons):
+        polys = []
+        for points, _ in polygons:
+            if len(points) >= 6:
+                polys.append([round(v) for v in points])
+        if not polys:
+            return bytearray()
+        x0, y0, x1, y1 = self._points_bounds([(p, True) for p in polys])
+        if x1 < x0 or y1 < y0:
+            return bytearray()
+        mono_fb = self.mono_fb
+        if len(polys) == 1:
+            mono_fb.fill_rect(x0, y0, x1 - x0 + 1, y1 - y0 + 1, 0)
+            mono_fb.poly(0, 0, array("i", polys[0]), 1, True)
+            return self.find_rects_in_fb(x0, x1, y0, y1, try_columns=False)
+
+        buf = mono_fb.draw_buf
+        stride = mono_fb.stride
+        # Whole bytes, so nothing outside the bounds is mixed in
+        b0 = x0 >> 3
+        row_bytes = (x1 >> 3) - b0 + 1
+        acc = bytearray(row_bytes * (y1 - y0 + 1))
+        for coords in polys:
+            mono_fb.fill_rect(b0 * 8, y0, row_bytes * 8, y1 - y0 + 1, 0)
+            mono_fb.poly(0, 0, array("i", coords), 1, True)
+            i = 0
+            for y in range(y0, y1 + 1):
+                row = y * stride + b0
+                for b in range(row, row + row_bytes):
+                    acc[i] ^= buf[b]
+                    i += 1
+        i = 0
+        for y in range(y0, y1 + 1):
+            row = y * stride + b0
+            buf[row:row + row_bytes] = acc[i:i + row_bytes]
+            i += row_bytes
+        for coords in polys:
+            mono_fb.poly(0, 0, array("i", coords), 1, False)
+        return self.find_rects_in_fb(x0, x1, y0, y1, try_columns=False)
+
+    def draw_polylines(self, polylines):
+        polylines = [([round(v) for v in points], closed) for points, closed in polylines]
+        x0, y0, x1, y1 = self._points_bounds(polylines)
+        if x1 < x0 or y1 < y0:
+            return bytearray()
+        mono_fb = self.mono_fb
+        mono_fb.fill_rect(x0, y0, x1 - x0 + 1, y1 - y0 + 1, 0)
+        for coords, closed in polylines:
+            for i in range(2, len(coords), 2):
+                mono_fb.line(coords[i - 2], coords[i - 1], coords[i], coords[i + 1], 1)
+            if closed and len(coords) >= 4:
+                mono_fb.line(coords[-2], coords[-1], coords[0], coords[1], 1)
+        return self.find_rects_in_fb(x0, x1, y0, y1, try_columns=False)
+
     def draw_svg(self, svg):
         data = []
         for shape in svg.shapes:
-            name = shape.name
-            if name is "rect":
-                if 'fill' in shape.attributes and shape.attributes['fill'] is not None:
-                    data.append((
-                        rgb_to_565(shape.attributes['fill']), 
-                        Rect(
-                            shape.attributes['x'],
-                            shape.attributes['y'],
-                            shape.attributes['width'],
-                            shape.attributes['height']
-                        )
-                    ))
-                if 'stroke' in shape.attributes and shape.attributes['stroke'] is not None:
-                    data.append((
-                        rgb_to_565(shape.attributes['stroke']),
-                        self.draw_rect(
-                            shape.attributes['x'], 
-                            shape.attributes['y'],
-                            shape.attributes['width'],
-                            shape.attributes['height'],
-                            fill=False,
-                            thickness=shape.attributes['stroke-width']
-                        )
-                    ))
-            elif name is "circle" or name is "ellipse":
-                rx = shape.attributes['rx'] if name is "ellipse" else shape.attributes['r']
-                ry = shape.attributes['ry'] if name is "ellipse" else shape.attributes['r']
-                if 'fill' in shape.attributes and shape.attributes['fill'] is not None:
-                    data.append((
-                        rgb_to_565(shape.attributes['fill']),
-                        self.draw_ellipse(
-                            shape.attributes['cx'], 
-                            shape.attributes['cy'], 
-                            rx, 
-                            ry
-                        )
-                    ))
-                if 'stroke' in shape.attributes and shape.attributes['stroke'] is not None:
-                    data.append((
-                        rgb_to_565(shape.attributes['stroke']),
-                        self.draw_ellipse(
-                            shape.attributes['cx'], 
-                            shape.attributes['cy'], 
-                            rx, 
-                            ry, 
-                            False
-                        )
-                    ))
-            elif name is "line":
-                if 'stroke' in shape.attributes and shape.attributes['stroke'] is not None:
-                    data.append((
-                        rgb_to_565(shape.attributes['stroke']),
-                        self.draw_line(
-                            shape.attributes['x1'], 
-                            shape.attributes['y1'], 
-                            shape.attributes['x2'], 
-                            shape.attributes['y2']
-                        )
-                    ))
+            data.extend(self.draw_svg_shape(shape))
+        return data
+
+    # (colour, rects) for each part (fill, stroke) of one SVG shape
+    def draw_svg_shape(self, shape):
+        data = []
+        name = shape.name
+        if name == "rect":
+            if 'fill' in shape.attributes and shape.attributes['fill'] is not None:
+                data.append((
+                    rgb_to_565(shape.attributes['fill']), 
+                    self.draw_rect(
+                        shape.attributes['x'],
+                        shape.attributes['y'],
+                        shape.attributes['width'],
+                        shape.attributes['height']
+                    )
+                ))
+            if 'stroke' in shape.attributes and shape.attributes['stroke'] is not None:
+                data.append((
+                    rgb_to_565(shape.attributes['stroke']),
+                    self.draw_rect(
+                        shape.attributes['x'], 
+                        shape.attributes['y'],
+                        shape.attributes['width'],
+                        shape.attributes['height'],
+                        fill=False,
+                        thickness=shape.attributes['stroke-width']
+                    )
+                ))
+        elif name == "circle" or name == "ellipse":
+            rx = shape.attributes['rx'] if name == "ellipse" else shape.attributes['r']
+            ry = shape.attributes['ry'] if name == "ellipse" else shape.attributes['r']
+            if 'fill' in shape.attributes and shape.attributes['fill'] is not None:
+                data.append((
+                    rgb_to_565(shape.attributes['fill']),
+                    self.draw_ellipse(
+                        shape.attributes['cx'], 
+                        shape.attributes['cy'], 
+                        rx, 
+                        ry
+                    )
+                ))
+            if 'stroke' in shape.attributes and shape.attributes['stroke'] is not None:
+                data.append((
+                    rgb_to_565(shape.attributes['stroke']),
+                    self.draw_ellipse(
+                        shape.attributes['cx'], 
+                        shape.attributes['cy'], 
+                        rx, 
+                        ry, 
+                        False
+                    )
+                ))
+        elif name == "line":
+            if 'stroke' in shape.attributes and shape.attributes['stroke'] is not None:
+                data.append((
+                    rgb_to_565(shape.attributes['stroke']),
+                    self.draw_line(
+                        shape.attributes['x1'], 
+                        shape.attributes['y1'], 
+                        shape.attributes['x2'], 
+                        shape.attributes['y2']
+                    )
+                ))
+        elif name == "path" or name == "polygon" or name == "polyline":
+            subpaths = shape.attributes['d'] if name == "path" else shape.attributes['points']
+            if 'fill' in shape.attributes and shape.attributes['fill'] is not None:
+                data.append((
+                    rgb_to_565(shape.attributes['fill']),
+                    self.draw_polygons(subpaths)
+                ))
+            if 'stroke' in shape.attributes and shape.attributes['stroke'] is not None:
+                data.append((
+                    rgb_to_565(shape.attributes['stroke']),
+                    self.draw_polylines(subpaths)
+                ))
         return data
         
+# Base for full-colour renderers that composite off-screen. Shapes are still decomposed into rects
+# by a MonoFrameBufRenderer; subclasses decide what to do with the rects and colours they are given.
+class CompositingRenderer(Renderer):
+    retained = True
+
+    def __init__(self, width, height, cache_font=True, font_cache_file=None):
+        self.width = width
+        self.height = height
+        self.shapes = MonoFrameBufRenderer(width, height, cache_font, font_cache_file)
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        self.shapes.resize(width, height)
+
+    def draw_rect(self, x, y, w, h, fill=True, thickness=1):
+        return self.shapes.draw_rect(x, y, w, h, fill, thickness)
+
+    def draw_text(self, text, x, y, font=None, scale=1):
+        return self.shapes.draw_text(text, x, y, font, scale)
+
+    def text_size(self, text, font=None):
+        return self.shapes.text_size(text, font)
+
+    def text_bitmap(self, text, font=None):
+        return self.shapes.text_bitmap(text, font)
+
+    def draw_hline(self, x, y, w):
+        return self.shapes.draw_hline(x, y, w)
+
+    def draw_vline(self, x, y, h):
+        return self.shapes.draw_vline(x, y, h)
+
+    def draw_line(self, x1, y1, x2, y2):
+        return self.shapes.draw_line(x1, y1, x2, y2)
+
+    def draw_poly(self, x, y, coords, fill=True, convex=False):
+        return self.shapes.draw_poly(x, y, coords, fill, convex)
+
+    def draw_ellipse(self, x, y, rx, ry, fill=True):
+        return self.shapes.draw_ellipse(x, y, rx, ry, fill)
+
+    def draw_polygons(self, polygons):
+        return self.shapes.draw_polygons(polygons)
+
+    def draw_polylines(self, polylines):
+        return self.shapes.draw_polylines(polylines)
+
+    def draw_svg(self, svg):
+        return self.shapes.draw_svg(svg)
+
+    def draw_svg_shape(self, shape):
+        return self.shapes.draw_svg_shape(shape)
+
+# Full-colour renderer keeping an RGB565 shadow of the screen. Draws are composited into the shadow
+# buffer and only the dirty regions are sent when the driver's show() is called, one RAMWR each.
+class RGB565FrameBufRenderer(CompositingRenderer):
+    def __init__(self, width, height, cache_font=True, max_dirty=8, font_cache_file=None):
+        super().__init__(width, height, cache_font, font_cache_file)
+        self.max_dirty = max_dirty
+        self.buf = bytearray(width * height * 2)
+        self.buf_ref = memoryview(self.buf)
+        self.fb = framebuf.FrameBuffer(self.buf_ref, width, height, framebuf.RGB565)
+        # Dirty regions as [x0, y0, x1, y1], end exclusive
+        self.dirty = []
+
+    def resize(self, width, height):
+        if width != self.width or height != self.height:
+            super().resize(width, height)
+            self.fb = framebuf.FrameBuffer(self.buf_ref, width, height, framebuf.RGB565)
+            self.mark_dirty(0, 0, width, height)
+
+    def add_rects(self, data, c: bytes):
+        fill_rect = self.fb.fill_rect
+        # The buffer is sent as-is, so store the colour with its bytes in wire order
+        colour = c[0] | (c[1] << 8)
+        width = self.width
+        height = self.height
+        x0 = width
+        y0 = height
+        x1 = 0
+        y1 = 0
+        for i in range(0, len(data), 4):
+            x = data[i]
+            y = data[i + 1]
+            w = data[i + 2]
+            h = data[i + 3]
+            if w <= 0 or h <= 0:
+                continue
+            fill_rect(x, y, w, h, colour)
+            x0 = min(x0, x)
+            y0 = min(y0, y)
+            x1 = max(x1, x + w)
+            y1 = max(y1, y + h)
+        self.mark_dirty(max(x0, 0), max(y0, 0), min(x1, width), min(y1, height))
+
+    def mark_dirty(self, x0, y0, x1, y1):
+        add_region(self.dirty, x0, y0, x1, y1, self.max_dirty)
+
+    def flush(self, tft):
+        width = self.width
+        buf = self.buf_ref
+        for x0, y0, x1, y1 in self.dirty:
+            offset = (y0 * width + x0) * 2
+            tft.send_window(x0, y0, x1 - x0, y1 - y0, buf[offset:], width)
+        self.dirty = []
+
+# Full-colour renderer for targets without RAM for a whole shadow buffer. Draws are recorded into a
+# display list, and show() rasterizes the screen in horizontal bands of band_height rows into one
+# small strip buffer, sending each band with a single window write. Only bands touched since the
+# last show() are sent. The list is reset whenever a draw covers the whole screen (fill_screen), so
+# redraw each frame starting with a fill to keep it short.
+class BandedRenderer(CompositingRenderer):
+    def __init__(self, width, height, cache_font=True, band_height=16, background=b'\x00\x00', font_cache_file=None):
+        super().__init__(width, height, cache_font, font_cache_file)
+        self.strip = bytearray(width * band_height * 2)
+        self.strip_ref = memoryview(self.strip)
+        self._make_strip_fb()
+        self.background = background[0] | (background[1] << 8)
+        # Display list of (rects, colour, top, bottom), bottom exclusive
+        self.display_list = []
+        # Rows touched since the last flush, bottom exclusive
+        self.dirty_top = 0
+        self.dirty_bottom = height
+
+    def _make_strip_fb(self):
+        # Keep the strip size fixed, so the band is as many rows as fit in it
+        self.band_height = len(self.strip) // (self.width * 2)
+        self.strip_fb = framebuf.FrameBuffer(self.strip_ref, self.width, self.band_height, framebuf.RGB565)
+
+    def resize(self, width, height):
+        if width != self.width or height != self.height:
+            super().resize(width, height)
+            self._make_strip_fb()
+            self.dirty_top = 0
+            self.dirty_bottom = height
+
+    def add_rects(self, data, c: bytes):
+        colour = c[0] | (c[1] << 8)
+        size = len(data)
+        if size == 4 and data[0] <= 0 and data[1] <= 0 and data[2] >= self.width and data[3] >= self.height:
+            # Covers the whole screen, everything drawn so far is hidden
+            self.display_list = []
+            self.background = colour
+            self.dirty_top = 0
+            self.dirty_bottom = self.height
+            return
+
+        top = self.height
+        bottom = 0
+        for i in range(0, size, 4):
+            if data[i + 2] > 0 and data[i + 3] > 0:
+                top = min(top, data[i + 1])
+                bottom = max(bottom, data[i + 1] + data[i + 3])
+        if bottom <= top:
+            return
+        # Copy, the caller may reuse its buffer
+        self.display_list.append((bytes(data), colour, top, bottom))
+        self.dirty_top = min(self.dirty_top, top)
+        self.dirty_bottom = max(self.dirty_bottom, bottom)
+
+    def flush(self, tft):
+        width = self.width
+        height = self.height
+        band_height = self.band_height
+        strip_fb = self.strip_fb
+        fill_rect = strip_fb.fill_rect
+        start = max(0, self.dirty_top)
+        # Align to the band grid so repeated flushes rasterize the same bands
+        band_y = start - start % band_height
+        end = min(height, self.dirty_bottom)
+        while band_y < end:
+            rows = min(band_height, height - band_y)
+            band_bottom = band_y + rows
+            strip_fb.fill(self.background)
+            for data, colour, top, bottom in self.display_list:
+                if bottom <= band_y or top >= band_bottom:
+                    continue
+                for i in range(0, len(data), 4):
+                    fill_rect(data[i], data[i + 1] - band_y, data[i + 2], data[i + 3], colour)
+            tft.send_window(0, band_y, width, rows, self.strip_ref)
+            band_y = band_bottom
+        self.dirty_top = height
+        self.dirty_bottom = 0
+
+    # Drop the display list, leaving an empty screen of the background colour
+    def clear(self, background=None):
+        if background is not None:
+            self.background = background[0] | (background[1] << 8)
+        self.display_list = []
+        self.dirty_top = 0
+        self.dirty_bottom = self.height
+
 class ST7735:
-    def __init__(self, dc, cs, rt, sck, mosi, miso, spi_port, baud=62_500_000, height=160, width=80, cache_font=True, renderer: Renderer | None = None):
+    def __init__(self, dc, cs, rt, sck, mosi, miso, spi_port, baud=62_500_000, height=160, width=80, cache_font=True, renderer: Renderer | None = None, fill_chunk=1024, font_cache_file=None, label_cache_size=1024):
         self.dc_pin = Pin(dc, Pin.OUT, value=1)
         self.cs_pin = Pin(cs, Pin.OUT, value=1)
         self.rt_pin = Pin(rt, Pin.OUT, value=1)
@@ -473,33 +1153,85 @@ class ST7735:
         self.c_offset = 24
         self.r_offset = 0
         self.flipped = False
+        self.rotation = 0
+        self.madctl = 0x08
+        # (top, height) of the hardware scroll area while scrolling, see set_scroll_region
+        self.scroll_region = None
+        # (top, height) of the rows shown in partial mode, see set_partial
+        self.partial_rows = None
+        self.idle = False
+        self.sleeping = False
+        self._sleep_ticks = 0
 
         # Theorhetical max is half of the system frequency (125MHz / 2)
         self.spi = SPI(spi_port, baud, polarity=0, phase=0, firstbit=SPI.MSB, sck=self.sck_pin, mosi=self.mosi_pin, miso=self.miso_pin)
         if renderer is None:
-            self.renderer = MonoFrameBufRenderer(width, height, cache_font)
+            self.renderer = MonoFrameBufRenderer(width, height, cache_font, font_cache_file)
         else:
             self.renderer = renderer
 
+        # Reusable CASET/RASET argument buffer for send_rects
+        self._window_args = bytearray(8)
+        window_args_ref = memoryview(self._window_args)
+        self._caset_args = window_args_ref[0:4]
+        self._raset_args = window_args_ref[4:8]
+        # Last column and row ranges programmed with CASET/RASET, packed as (start << 16) | end
+        self._window_cols = -1
+        self._window_rows = -1
+
+        # Preallocated buffer holding a run of one colour, streamed in chunks to fill rects so peak
+        # RAM doesn't depend on the rect size. Kept to a whole number of pixels.
+        fill_chunk = max(2, fill_chunk - fill_chunk % 2)
+        self._fill_buf = bytearray(fill_chunk)
+        self._fill_buf_ref = memoryview(self._fill_buf)
+        self._fill_colour = None
+
+        # Line buffer and nibble expansion table for opaque text, see _blit_text
+        self._line_buf = bytearray(((max(width, height) + 7) >> 3) * 16)
+        self._line_buf_ref = memoryview(self._line_buf)
+        self._nibble_table = bytearray(16 * 8)
+        self._nibble_table_ref = memoryview(self._nibble_table)
+        self._nibble_colours = None
+
+        # Rects of recently drawn strings composed at 0, 0, keyed by (text, font, scale), so
+        # repeated labels are only translated when sent. None if label_cache_size is 0, in which
+        # case fonts.py isn't needed.
+        self.label_cache = None
+        if label_cache_size > 0:
+            from fonts import LRUCache
+            self.label_cache = LRUCache(label_cache_size)
+
+    # Forget the programmed address window so the next rect sends both CASET and RASET
+    def invalidate_window(self):
+        self._window_cols = -1
+        self._window_rows = -1
+
+    # Send a command and its arguments in a single CS window, toggling DC between them
     def send_command(self, cmd : bytes, args : bytes | None = None):
         cs_pin = self.cs_pin
         dc_pin = self.dc_pin
         spi = self.spi
 
+        if cmd == ST7735_CASET or cmd == ST7735_RASET or cmd == ST7735_SWRESET:
+            self.invalidate_window()
+
         cs_pin.low()
         dc_pin.low()
         spi.write(cmd)
-        cs_pin.high()
         dc_pin.high()
 
         if args is not None and len(args) > 0:
-            cs_pin.low()
             spi.write(args)
-            cs_pin.high()
-            dc_pin.high()
+        cs_pin.high()
 
     def tft_initialize(self):
         send_cmd = self.send_command
+        self.invalidate_window()
+        # The reset returns the panel to normal mode, which init_cmds leaves it in
+        self.scroll_region = None
+        self.partial_rows = None
+        self.idle = False
+        self.sleeping = False
         self.rt_pin.low()
         time.sleep_ms(100)
         self.rt_pin.high()
@@ -507,9 +1239,17 @@ class ST7735:
 
         for cmd in init_cmds:
             send_cmd(cmd[0], None if len(cmd) == 1 else bytes(cmd[1:]))
+        # init_cmds ends sleep, so the next SLPIN has to wait out the delay as after wake()
+        self._sleep_ticks = time.ticks_ms()
+        # The reset also cleared MADCTL, so restore the rotation the driver's coordinates are in
+        send_cmd(ST7735_MADCTL, bytes((self.madctl,)))
 
     def set_rotation(self, rotation, mirror_x=False, mirror_y=False):
         r = rotation % 4
+        # Scrolling and partial mode work on panel rows, which don't stay rows when rotated
+        if self.scroll_region is not None or self.partial_rows is not None:
+            self.normal_mode()
+        self.rotation = r
         flipped = rotation % 2 == 1
         self.c_offset = 24 if not flipped else 0
         self.r_offset = 24 if flipped else 0
@@ -518,82 +1258,440 @@ class ST7735:
             self.height = self.width
             self.width = h
             self.flipped = flipped
-            # self.draw_buf = array("B", bytes(self.draw_buf_size * [0x00]))
-            # self.frame_buf = framebuf.FrameBuffer(memoryview(self.draw_buf), self.width, self.height, framebuf.MONO_HLSB)
+            self.renderer.resize(self.width, self.height)
+            # Labels were clipped to the old width
+            if self.label_cache is not None:
+                self.label_cache.clear()
+
+        # The offsets and axes changed, so the programmed window no longer means the same thing
+        self.invalidate_window()
 
         madctl_arg = (0x08, 0x6C, 0xDC, 0xB8)[r]
         if mirror_x:
             madctl_arg = madctl_arg ^ 0x40
         if mirror_y:
             madctl_arg = madctl_arg ^ 0x80
-        self.send_command(ST7735_MADCTL, bytes(madctl_arg))
+        self.madctl = madctl_arg
+        self.send_command(ST7735_MADCTL, bytes((madctl_arg,)))
+
+    # Set up hardware vertical scrolling of the rows top to top + height - 1. The rows above and below
+    # stay fixed. The panel scans along the long side, so this is only vertical in rotation 0.
+    def set_scroll_region(self, top, height):
+        if self.rotation != 0:
+            raise ValueError("Hardware scrolling is only supported in rotation 0")
+        if top < 0 or height <= 0 or top + height > self.height:
+            raise ValueError("Scroll region out of range")
+        if self.partial_rows is not None:
+            self.normal_mode()
+        top_fixed = self.r_offset + top
+        bottom_fixed = FRAME_ROWS - top_fixed - height
+        self.send_command(ST7735_VSCRDEF, bytes((top_fixed >> 8, top_fixed & 0xFF, height >> 8, height & 0xFF, bottom_fixed >> 8, bottom_fixed & 0xFF)))
+        self.scroll_region = (top, height)
+        self.scroll_to(0)
+
+    # Show the scroll area starting from its row offset, wrapping around. Drawing is unaffected:
+    # coordinates still address the unscrolled rows, so row top + offset is now shown at the top of
+    # the area.
+    def scroll_to(self, offset):
+        top, height = self.scroll_region
+        start = self.r_offset + top + offset % height
+        self.send_command(ST7735_VSCRSADD, bytes((start >> 8, start & 0xFF)))
+
+    # Leave scrolling, back to showing every row where it is drawn
+    def stop_scroll(self):
+        self.normal_mode()
+
+    # Partial mode: only rows top to top + height - 1 are refreshed, the rest of the panel is
+    # blank. Drawing outside the rows still updates memory, shown on return to normal mode. Like
+    # scrolling, this works on panel rows so is only supported in rotation 0.
+    def set_partial(self, top, height):
+        if self.rotation != 0:
+            raise ValueError("Partial mode is only supported in rotation 0")
+        if top < 0 or height <= 0 or top + height > self.height:
+            raise ValueError("Partial rows out of range")
+        start = self.r_offset + top
+        end = start + height - 1
+        self.send_command(ST7735_PTLAR, bytes((start >> 8, start & 0xFF, end >> 8, end & 0xFF)))
+        # Partial mode replaces scrolling
+        self.send_command(ST7735_PTLON)
+        self.scroll_region = None
+        self.partial_rows = (top, height)
+
+    # Back to refreshing the whole panel, leaving partial mode or scrolling
+    def normal_mode(self):
+        self.send_command(ST7735_NORON)
+        self.scroll_region = None
+        self.partial_rows = None
+
+    # Idle mode shows 8 colours, the top bit of each of red, green and blue, for lower power
+    def set_idle(self, idle):
+        self.send_command(ST7735_IDMON if idle else ST7735_IDMOFF)
+        self.idle = idle
+
+    # Sleep the panel. Memory is kept and can still be drawn to, but nothing is shown.
+    def sleep(self):
+        if self.sleeping:
+            return
+        self._wait_sleep_delay()
+        self.send_command(ST7735_SLPIN)
+        self._sleep_ticks = time.ticks_ms()
+        self.sleeping = True
 
-    def send_rects(self, data: bytes, c: bytes):
+    # Wake the panel from sleep, once it is ready to take the next command
+    def wake(self):
+        if not self.sleeping:
+            return
+        self._wait_sleep_delay()
+        self.send_command(ST7735_SLPOUT)
+        self._sleep_ticks = time.ticks_ms()
+        self.sleeping = False
+        time.sleep_ms(SLEEP_DELAY_MS)
+        # Make sure the panel's orientation matches ours, and forget the cached window in case
+        # the panel didn't keep it
+        self.send_command(ST7735_MADCTL, bytes((self.madctl,)))
+        self.invalidate_window()
+
+    # The panel ignores SLPIN/SLPOUT until SLEEP_DELAY_MS after the last one
+    def _wait_sleep_delay(self):
+        elapsed = time.ticks_diff(time.ticks_ms(), self._sleep_ticks)
+        if 0 <= elapsed < SLEEP_DELAY_MS:
+            time.sleep_ms(SLEEP_DELAY_MS - elapsed)
+
+    # Pattern the fill buffer with the colour c, doubling the filled part each step
+    def _set_fill_colour(self, c: bytes):
+        buf = self._fill_buf_ref
+        size = len(buf)
+        buf[0] = c[0]
+        buf[1] = c[1]
+        filled = 2
+        while filled < size:
+            n = min(filled, size - filled)
+            buf[filled:filled + n] = buf[0:n]
+            filled += n
+        self._fill_colour = bytes(c)
+
+    # Fill each rect in data ([x, y, w, h, x, y, w, h, ...]) with the colour c, the rects moved by
+    # dx, dy and clipped to the screen. The whole batch is sent in one CS window; only DC toggles between commands and data, and the
+    # window arguments are encoded into a buffer that is reused for every rect. CASET and RASET are
+    # only sent when the column or row range differs from the one already programmed.
+    def send_rects(self, data: bytes, c: bytes, dx=0, dy=0):
         # Local copy of functions for performance
         c_offset = self.c_offset
         r_offset = self.r_offset
-        send_cmd = self.send_command
         cs_pin = self.cs_pin
         dc_pin = self.dc_pin
+        spi_write = self.spi.write
+        caset_args = self._caset_args
+        raset_args = self._raset_args
+        window_cols = self._window_cols
+        window_rows = self._window_rows
+        if c != self._fill_colour:
+            self._set_fill_colour(c)
+        fill_buf = self._fill_buf_ref
+        fill_chunk = len(fill_buf)
         size = len(data)
         i = 0
+        # Rects from the renderer are on screen, only moved ones need clipping
+        moved = dx or dy
+        width = self.width
+        height = self.height
 
+        cs_pin.low()
         while i < size:
-            x = data[i]
-            y = data[i + 1]
+            x = data[i] + dx
+            y = data[i + 1] + dy
             w = data[i + 2]
             h = data[i + 3]
-            caset_args = bytes((
-                ((c_offset + x) >> 8) & 0xFF,
-                (c_offset + x) & 0xFF,
-                ((c_offset + x + w - 1) >> 8) & 0xFF,
-                (c_offset + x + w - 1) & 0xFF
-            ))
-            send_cmd(ST7735_CASET, caset_args)
+            i += 4
+            if moved:
+                if x < 0:
+                    w += x
+                    x = 0
+                if y < 0:
+                    h += y
+                    y = 0
+                w = min(w, width - x)
+                h = min(h, height - y)
+            if w <= 0 or h <= 0:
+                continue
+
+            # Set column range
+            start = c_offset + x
+            end = start + w - 1
+            if (start << 16) | end != window_cols:
+                window_cols = (start << 16) | end
+                caset_args[0] = (start >> 8) & 0xFF
+                caset_args[1] = start & 0xFF
+                caset_args[2] = (end >> 8) & 0xFF
+                caset_args[3] = end & 0xFF
+                dc_pin.low()
+                spi_write(ST7735_CASET)
+                dc_pin.high()
+                spi_write(caset_args)
+
             # Set row range
-            
-            raset_args = bytes((
-                ((r_offset + y) >> 8) & 0xFF,
-                (r_offset + y) & 0xFF,
-                ((r_offset + y + h - 1) >> 8) & 0xFF,
-                (r_offset + y + h - 1) & 0xFF
-            ))
-            send_cmd(ST7735_RASET, raset_args)
+            start = r_offset + y
+            end = start + h - 1
+            if (start << 16) | end != window_rows:
+                window_rows = (start << 16) | end
+                raset_args[0] = (start >> 8) & 0xFF
+                raset_args[1] = start & 0xFF
+                raset_args[2] = (end >> 8) & 0xFF
+                raset_args[3] = end & 0xFF
+                dc_pin.low()
+                spi_write(ST7735_RASET)
+                dc_pin.high()
+                spi_write(raset_args)
+
             # Start memory write
-            send_cmd(ST7735_RAMWR)
+            dc_pin.low()
+            spi_write(ST7735_RAMWR)
+            dc_pin.high()
+            remaining = w * h * 2
+            while remaining >= fill_chunk:
+                spi_write(fill_buf)
+                remaining -= fill_chunk
+            if remaining > 0:
+                spi_write(fill_buf[0:remaining])
+        cs_pin.high()
+        self._window_cols = window_cols
+        self._window_rows = window_rows
+
+    # Write a block of RGB565 pixels to the window at x, y in one RAMWR. buf starts at the block's
+    # first pixel and its rows are stride pixels apart (w if not given).
+    def send_window(self, x, y, w, h, buf, stride=None):
+        if w <= 0 or h <= 0:
+            return
+        cs_pin = self.cs_pin
+        dc_pin = self.dc_pin
+        spi_write = self.spi.write
+        buf = memoryview(buf)
+        row_bytes = w * 2
+        stride_bytes = row_bytes if stride is None else stride * 2
 
-            cs_pin.low()
-            self.spi.write(c * (w * h))
-            cs_pin.high()
+        cs_pin.low()
+        self._set_window(x, y, w, h)
+        dc_pin.low()
+        spi_write(ST7735_RAMWR)
+        dc_pin.high()
+        if stride_bytes == row_bytes:
+            spi_write(buf[0:row_bytes * h])
+        else:
+            offset = 0
+            for _ in range(h):
+                spi_write(buf[offset:offset + row_bytes])
+                offset += stride_bytes
+        cs_pin.high()
+
+    # Program the address window, skipping whichever of CASET and RASET is already set.
+    # Must be called with CS low.
+    def _set_window(self, x, y, w, h):
+        dc_pin = self.dc_pin
+        spi_write = self.spi.write
+
+        start = self.c_offset + x
+        end = start + w - 1
+        if (start << 16) | end != self._window_cols:
+            self._window_cols = (start << 16) | end
+            args = self._caset_args
+            args[0] = (start >> 8) & 0xFF
+            args[1] = start & 0xFF
+            args[2] = (end >> 8) & 0xFF
+            args[3] = end & 0xFF
+            dc_pin.low()
+            spi_write(ST7735_CASET)
             dc_pin.high()
-            i += 4
+            spi_write(args)
+
+        start = self.r_offset + y
+        end = start + h - 1
+        if (start << 16) | end != self._window_rows:
+            self._window_rows = (start << 16) | end
+            args = self._raset_args
+            args[0] = (start >> 8) & 0xFF
+            args[1] = start & 0xFF
+            args[2] = (end >> 8) & 0xFF
+            args[3] = end & 0xFF
+            dc_pin.low()
+            spi_write(ST7735_RASET)
+            dc_pin.high()
+            spi_write(args)
+
+    # Send rects to the panel, or to the renderer if it composites off-screen
+    def _draw(self, data, c: bytes, dx=0, dy=0):
+        if self.renderer.retained:
+            if dx or dy:
+                data = translate_rects(data, dx, dy, self.width, self.height)
+            self.renderer.add_rects(data, c)
+        else:
+            self.send_rects(data, c, dx, dy)
+
+    # Draw a rect list, such as one returned by the renderer, in colour c moved by dx, dy
+    def draw_rects(self, data, c: bytes, dx=0, dy=0):
+        self._draw(data, c, dx, dy)
+
+    # Update the panel with everything drawn since the last call. Only needed with a retained
+    # renderer such as RGB565FrameBufRenderer; immediate renderers draw straight to the panel.
+    def show(self):
+        if self.renderer.retained:
+            self.renderer.flush(self)
 
     def fill_screen(self, c: bytes):
-        self.send_rects(bytes((0, 0, self.width, self.height)), c)
+        self._draw(bytes((0, 0, self.width, self.height)), c)
 
     def draw_rect(self, x, y, w, h, c: bytes, fill=True, thickness=1):
-        self.send_rects(self.renderer.draw_rect(x, y, w, h, fill, thickness), c)
+        self._draw(self.renderer.draw_rect(x, y, w, h, fill, thickness), c)
+
+    # Draw text in colour c. With a background colour bg the text is opaque: its whole cell is
+    # painted by blitting the glyphs expanded to RGB565 a row at a time in one window write, which
+    # sends each pixel once. Retained renderers composite, so they get a background rect and the
+    # glyph rects instead, as does text starting above or left of the screen. scale draws each font
+    # pixel as a scale x scale square. Text is clipped to the screen.
+    def draw_text(self, text, x, y, c: bytes, font=None, bg: bytes | None = None, scale=1):
+        renderer = self.renderer
+        if bg is None:
+            rects, dx, dy = self.text_rects(text, x, y, font, scale)
+            self._draw(rects, c, dx, dy)
+            return
 
-    def draw_text(self, text, x, y, c: bytes):
-        self.send_rects(self.renderer.draw_text(text, x, y), c)
+        w, h = renderer.text_size(text, font)
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        w = min(x + w * scale, self.width) - x0
+        h = min(y + h * scale, self.height) - y0
+        if w <= 0 or h <= 0:
+            return
+        if renderer.retained or x < 0 or y < 0:
+            rects, dx, dy = self.text_rects(text, x, y, font, scale)
+            self._draw(bytes((x0, y0, w, h)), bg)
+            self._draw(rects, c, dx, dy)
+        else:
+            self._blit_text(text, x, y, w, h, c, bg, font, scale)
+
+    # Rects for text and the offset to send them at. Strings are composed at 0, 0 and kept in the
+    # label cache. Each entry is the text width as 2 bytes followed by the rects. The renderer can't
+    # place rects above or left of the screen, so text there is always composed at 0, 0 and moved.
+    def text_rects(self, text, x, y, font, scale):
+        cache = self.label_cache
+        if cache is None:
+            if x < 0 or y < 0:
+                return self.renderer.draw_text(text, 0, 0, font, scale), x, y
+            return self.renderer.draw_text(text, x, y, font, scale), 0, 0
+        key = (text, font, scale)
+        label = cache.get(key)
+        if label is None:
+            rects = self.renderer.draw_text(text, 0, 0, font, scale)
+            width = self.renderer.text_size(text, font)[0] * scale
+            label = width.to_bytes(2, 'little') + bytes(rects)
+            cache.put(key, label)
+        # Only the part of a cached label that fits in the screen width was composed
+        if x + (label[0] | (label[1] << 8)) > self.width and x > 0:
+            return self.renderer.draw_text(text, x, y, font, scale), 0, 0
+        return memoryview(label)[2:], x, y
+
+    # Expand the rasterized text to RGB565 a row at a time into the line buffer and stream the rows
+    # into a single window
+    def _blit_text(self, text, x, y, w, h, c: bytes, bg: bytes, font=None, scale=1):
+        bitmap, stride = self.renderer.text_bitmap(text, font)
+        line = self._line_buf_ref
+        # Scaled rows are expanded a whole font pixel at a time, so may run up to scale - 1 pixels past w
+        if len(line) < (w + scale) * 2:
+            self._line_buf = bytearray(((w + scale + 7) >> 3) * 16)
+            self._line_buf_ref = line = memoryview(self._line_buf)
+        # 4 pixels of RGB565 for each nibble value, rebuilt when the colours change
+        if self._nibble_colours != (c, bg):
+            table = self._nibble_table
+            for nibble in range(16):
+                for bit in range(4):
+                    colour = c if nibble & (8 >> bit) else bg
+                    table[nibble * 8 + bit * 2] = colour[0]
+                    table[nibble * 8 + bit * 2 + 1] = colour[1]
+            self._nibble_colours = (c, bg)
+        table = self._nibble_table_ref
+        row_bytes = (w + 7) >> 3
+        spi_write = self.spi.write
+        dc_pin = self.dc_pin
+
+        self.cs_pin.low()
+        self._set_window(x, y, w, h)
+        dc_pin.low()
+        spi_write(ST7735_RAMWR)
+        dc_pin.high()
+        row = 0
+        if scale == 1:
+            for _ in range(h):
+                pos = 0
+                for i in range(row, row + row_bytes):
+                    b = bitmap[i]
+                    hi = (b >> 4) * 8
+                    lo = (b & 0x0F) * 8
+                    line[pos:pos + 8] = table[hi:hi + 8]
+                    line[pos + 8:pos + 16] = table[lo:lo + 8]
+                    pos += 16
+                spi_write(line[0:w * 2])
+                row += stride
+        else:
+            # Each font pixel becomes scale pixels across and each row is sent scale times
+            fg_run = c * scale
+            bg_run = bg * scale
+            run_len = 2 * scale
+            src_w = (w + scale - 1) // scale
+            rows_left = h
+            while rows_left > 0:
+                pos = 0
+                for px in range(src_w):
+                    line[pos:pos + run_len] = fg_run if bitmap[row + (px >> 3)] & bitmask[px & 7] else bg_run
+                    pos += run_len
+                for _ in range(min(scale, rows_left)):
+                    spi_write(line[0:w * 2])
+                rows_left -= scale
+                row += stride
+        self.cs_pin.high()
 
     def draw_hline(self, x, y, w, c: bytes):
-        self.send_rects(self.renderer.draw_hline(x, y, w), c)
+        self._draw(self.renderer.draw_hline(x, y, w), c)
 
     def draw_vline(self, x, y, h, c: bytes):
-        self.send_rects(self.renderer.draw_vline(x, y, h), c)
+        self._draw(self.renderer.draw_vline(x, y, h), c)
 
     def draw_line(self, x1, y1, x2, y2, c: bytes):
-        self.send_rects(self.renderer.draw_line(x1, y1, x2, y2), c)
+        self._draw(self.renderer.draw_line(x1, y1, x2, y2), c)
 
     def draw_poly(self, x, y, coords, c: bytes, fill=True, convex=False):
-        self.send_rects(self.renderer.draw_poly(x, y, coords, fill, convex), c)
+        self._draw(self.renderer.draw_poly(x, y, coords, fill, convex), c)
 
     def draw_ellipse(self, x, y, rx, ry, c: bytes, fill = True):
-        self.send_rects(self.renderer.draw_ellipse(x, y, rx, ry, fill), c)
+        self._draw(self.renderer.draw_ellipse(x, y, rx, ry, fill), c)
 
+    # Draw a parsed svg.SVG, sending each shape as soon as it is rasterized
     def draw_svg(self, svg):
+        draw_svg_shape = self.renderer.draw_svg_shape
+        for shape in svg.shapes:
+            for c, b in draw_svg_shape(shape):
+                self._draw(b, c.to_bytes(2, 'big'))
+
+    # Draw an SVG straight from a text stream: each shape is parsed, rasterized and sent before the
+    # next is read, so memory use doesn't grow with the file and drawing starts straight away. With
+    # width and height the SVG's viewBox is fitted to that many pixels, see svg.SVG.read_svg.
+    def draw_svg_stream(self, stream, width=None, height=None):
+        from svg import SVG
+        draw_svg_shape = self.renderer.draw_svg_shape
+        for shape in SVG.iter_shapes(stream, width, height):
+            for c, b in draw_svg_shape(shape):
+                self._draw(b, c.to_bytes(2, 'big'))
+
+    # Render an SVG once into an svg.CachedSVG, which draw_cached_svg can draw without the renderer
+    def create_cached_svg(self, svg):
+        from svg import CachedSVG
+        cached_svg = CachedSVG()
         for c, b in self.renderer.draw_svg(svg):
-            self.send_rects(b, c)
+            cached_svg.add_rects(b, c.to_bytes(2, 'big'))
+        cached_svg.finish_caching()
+        return cached_svg
+
+    # Draw a cached SVG with its origin at x, y, sending each colour run as one batch of rects
+    def draw_cached_svg(self, cached_svg, x=0, y=0):
+        for c, rects in cached_svg.runs():
+            self._draw(rects, c, x, y)
         
         
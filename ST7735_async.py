@@ -0,0 +1,116 @@
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+# asyncio front end for an ST7735. Draw calls turn the shape into rects straight away and queue them;
+# a transmit task sends the queue batch_rects rects at a time, yielding to other tasks between
+# batches. Rendering the next draw overlaps with sending the previous ones. The queue holds at most
+# max_queue draws, when it is full draw calls wait for room, so a fast producer can't use up the RAM.
+# Start it with start(), and don't draw with the ST7735 directly while it is running.
+class AsyncST7735:
+    def __init__(self, tft, max_queue=4, batch_rects=8):
+        self.tft = tft
+        self.max_queue = max_queue
+        self.batch_rects = batch_rects
+        # Queued draws as (rects, colour, dx, dy). Rects of None means show().
+        self.queue = []
+        self._busy = False
+        self._not_full = asyncio.Event()
+        self._not_empty = asyncio.Event()
+        self._idle = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._transmit())
+        return self.task
+
+    # Send everything queued, then stop the transmit task
+    async def stop(self):
+        await self.flush()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    # Wait until everything queued has been sent
+    async def flush(self):
+        while self.queue or self._busy:
+            self._idle.clear()
+            await self._idle.wait()
+
+    async def _put(self, data, c, dx=0, dy=0):
+        while len(self.queue) >= self.max_queue:
+            self._not_full.clear()
+            await self._not_full.wait()
+        self.queue.append((data, c, dx, dy))
+        self._not_empty.set()
+
+    async def _transmit(self):
+        tft = self.tft
+        queue = self.queue
+        while True:
+            if not queue:
+                self._busy = False
+                self._idle.set()
+                self._not_empty.clear()
+                await self._not_empty.wait()
+                continue
+            self._busy = True
+            data, c, dx, dy = queue.pop(0)
+            self._not_full.set()
+            if data is None:
+                tft.show()
+                continue
+            step = self.batch_rects * 4
+            data = memoryview(data)
+            for i in range(0, len(data), step):
+                tft.draw_rects(data[i:i + step], c, dx, dy)
+                await asyncio.sleep(0)
+
+    async def show(self):
+        await self._put(None, None)
+
+    async def fill_screen(self, c: bytes):
+        await self._put(bytes((0, 0, self.tft.width, self.tft.height)), c)
+
+    async def draw_rects(self, data, c: bytes, dx=0, dy=0):
+        await self._put(data, c, dx, dy)
+
+    async def draw_rect(self, x, y, w, h, c: bytes, fill=True, thickness=1):
+        await self._put(self.tft.renderer.draw_rect(x, y, w, h, fill, thickness), c)
+
+    # Opaque text is queued as a background rect and the glyph rects, the single window blit
+    # ST7735.draw_text can use isn't split into batches
+    async def draw_text(self, text, x, y, c: bytes, font=None, bg: bytes | None = None, scale=1):
+        tft = self.tft
+        if bg is not None:
+            w, h = tft.renderer.text_size(text, font)
+            x0 = max(x, 0)
+            y0 = max(y, 0)
+            w = min(x + w * scale, tft.width) - x0
+            h = min(y + h * scale, tft.height) - y0
+            if w <= 0 or h <= 0:
+                return
+            await self._put(bytes((x0, y0, w, h)), bg)
+        rects, dx, dy = tft.text_rects(text, x, y, font, scale)
+        await self._put(rects, c, dx, dy)
+
+    async def draw_hline(self, x, y, w, c: bytes):
+        await self._put(self.tft.renderer.draw_hline(x, y, w), c)
+
+    async def draw_vline(self, x, y, h, c: bytes):
+        await self._put(self.tft.renderer.draw_vline(x, y, h), c)
+
+    async def draw_line(self, x1, y1, x2, y2, c: bytes):
+        await self._put(self.tft.renderer.draw_line(x1, y1, x2, y2), c)
+
+    async def draw_poly(self, x, y, coords, c: bytes, fill=True, convex=False):
+        await self._put(self.tft.renderer.draw_poly(x, y, coords, fill, convex), c)
+
+    async def draw_ellipse(self, x, y, rx, ry, c: bytes, fill=True):
+        await self._put(self.tft.renderer.draw_ellipse(x, y, rx, ry, fill), c)
+
+    async def draw_svg(self, svg):
+        for c, rects in self.tft.renderer.draw_svg(svg):
+            await self._put(rects, c.to_bytes(2, 'big'))
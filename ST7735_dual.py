@@ -0,0 +1,152 @@
+import _thread
+
+# Splits drawing between two threads: a render thread turns draws into rects while the calling
+# thread sends them. On the RP2040 the render thread runs on the second core, so rasterizing one draw
+# overlaps with sending the previous one. CPython has _thread too, so the same code runs on a PC.
+#
+# Draw calls only record the draw. flush() hands the recorded frame to the render thread and sends
+# the rects as they come back through a double buffer: two slots, each guarded by a pair of locks
+# used as semaphores (one held while the slot is empty, one while it is full), so neither thread
+# spins. Don't draw with the ST7735 directly while a flush is running; the renderer's scratch
+# buffers belong to the render thread. An exception while rendering or sending ends the frame and is
+# raised from flush(), and the pipeline is left ready for the next frame.
+class DualCoreST7735:
+    def __init__(self, tft):
+        self.tft = tft
+        # Draws recorded since the last flush as (render, args, colour). render returns rects, or
+        # (rects, dx, dy), or with a colour of None a list of (colour, rects). A render of None
+        # means args are the rects already.
+        self.pending = []
+        self._frame = None
+        self._frame_ready = _thread.allocate_lock()
+        self._frame_ready.acquire()
+        self._stopped = _thread.allocate_lock()
+        self._stopped.acquire()
+        self._slots = [None, None]
+        self._full = [_thread.allocate_lock(), _thread.allocate_lock()]
+        self._free = [_thread.allocate_lock(), _thread.allocate_lock()]
+        for lock in self._full:
+            lock.acquire()
+        self.running = False
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            _thread.start_new_thread(self._render_loop, ())
+
+    # End the render thread, waiting for it to finish
+    def stop(self):
+        if self.running:
+            self._frame = None
+            self._frame_ready.release()
+            self._stopped.acquire()
+            self.running = False
+
+    def _put(self, slot, item):
+        self._free[slot].acquire()
+        self._slots[slot] = item
+        self._full[slot].release()
+
+    def _render_loop(self):
+        slot = 0
+        while True:
+            self._frame_ready.acquire()
+            frame = self._frame
+            if frame is None:
+                break
+            end = None
+            try:
+                for render, args, c in frame:
+                    if render is None:
+                        result = args
+                    else:
+                        result = render(*args)
+                    if c is None:
+                        for layer_c, rects in result:
+                            self._put(slot, (rects, layer_c, 0, 0))
+                            slot ^= 1
+                        continue
+                    if type(result) is tuple:
+                        rects, dx, dy = result
+                    else:
+                        rects, dx, dy = result, 0, 0
+                    self._put(slot, (rects, c, dx, dy))
+                    slot ^= 1
+            except Exception as e:
+                # Hand the error to flush() in place of the rest of the frame
+                end = ("error", e)
+            # End of the frame
+            self._put(slot, end)
+            slot ^= 1
+        self._stopped.release()
+
+    # Render and send everything drawn since the last flush, then show() it
+    def flush(self):
+        self.start()
+        self._frame = self.pending
+        self.pending = []
+        self._frame_ready.release()
+
+        draw_rects = self.tft.draw_rects
+        error = None
+        slot = 0
+        while True:
+            self._full[slot].acquire()
+            item = self._slots[slot]
+            try:
+                if item is not None and len(item) == 4 and error is None:
+                    rects, c, dx, dy = item
+                    draw_rects(rects, c, dx, dy)
+            except Exception as e:
+                # Keep taking the rest of the frame so the render thread isn't left waiting on a slot
+                error = e
+            finally:
+                # Only free the slot once it's sent, so at most two rect buffers are alive
+                self._slots[slot] = None
+                self._free[slot].release()
+            slot ^= 1
+            if item is None or len(item) == 2:
+                break
+        if item is not None:
+            error = item[1]
+        if error is not None:
+            raise error
+        self.tft.show()
+
+    def fill_screen(self, c: bytes):
+        self.pending.append((None, bytes((0, 0, self.tft.width, self.tft.height)), c))
+
+    def draw_rects(self, data, c: bytes):
+        self.pending.append((None, data, c))
+
+    def draw_rect(self, x, y, w, h, c: bytes, fill=True, thickness=1):
+        self.pending.append((self.tft.renderer.draw_rect, (x, y, w, h, fill, thickness), c))
+
+    # Opaque text is drawn as a background rect and the glyph rects
+    def draw_text(self, text, x, y, c: bytes, font=None, bg: bytes | None = None, scale=1):
+        tft = self.tft
+        if bg is not None:
+            w, h = tft.renderer.text_size(text, font)
+            self.draw_rects(bytes((x, y, min(w * scale, tft.width - x), min(h * scale, tft.height - y))), bg)
+        self.pending.append((tft.text_rects, (text, x, y, font, scale), c))
+
+    def draw_hline(self, x, y, w, c: bytes):
+        self.pending.append((self.tft.renderer.draw_hline, (x, y, w), c))
+
+    def draw_vline(self, x, y, h, c: bytes):
+        self.pending.append((self.tft.renderer.draw_vline, (x, y, h), c))
+
+    def draw_line(self, x1, y1, x2, y2, c: bytes):
+        self.pending.append((self.tft.renderer.draw_line, (x1, y1, x2, y2), c))
+
+    def draw_poly(self, x, y, coords, c: bytes, fill=True, convex=False):
+        self.pending.append((self.tft.renderer.draw_poly, (x, y, coords, fill, convex), c))
+
+    def draw_ellipse(self, x, y, rx, ry, c: bytes, fill=True):
+        self.pending.append((self.tft.renderer.draw_ellipse, (x, y, rx, ry, fill), c))
+
+    def draw_svg(self, svg):
+        self.pending.append((self._svg_layers, (svg,), None))
+
+    def _svg_layers(self, svg):
+        return [(c.to_bytes(2, 'big'), rects) for c, rects in self.tft.renderer.draw_svg(svg)]
@@ -0,0 +1,882 @@
+# Host-side tests for the driver, run against the emulated panel in emulator.py.
+# Run with `python ST7735_host_test.py` or `python -m pytest ST7735_host_test.py`.
+import emulator
+panel = emulator.install(dc=22, cs=21, rt=15, spi_port=0)
+
+from ST7735 import ST7735, MonoFrameBufRenderer, RGB565FrameBufRenderer, BandedRenderer, merge_runs
+
+tft = ST7735(dc=22, cs=21, rt=15, sck=18, mosi=19, miso=16, spi_port=0)
+tft.tft_initialize()
+
+RED = b'\xF8\x00'
+BLUE = b'\x00\x1F'
+WHITE = b'\xFF\xFF'
+
+def lit(c: bytes):
+    c = (c[0] << 8) | c[1]
+    return [(x, y) for y in range(panel.height) for x in range(panel.width) if panel.pixel(x, y) == c]
+
+def test_fill_screen():
+    tft.set_rotation(0)
+    tft.fill_screen(RED)
+    assert panel.width == 80 and panel.height == 160
+    assert len(lit(RED)) == 80 * 160
+
+def test_draw_rect():
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    tft.draw_rect(10, 20, 5, 3, BLUE)
+    assert lit(BLUE) == [(x, y) for y in range(20, 23) for x in range(10, 15)]
+
+def test_counters():
+    tft.set_rotation(0)
+    panel.reset_counters()
+    tft.draw_rect(0, 0, 4, 4, BLUE)
+    assert panel.pixel_bytes == 4 * 4 * 2
+    assert panel.commands[0x2C] == 1
+
+def test_send_rects_single_transaction():
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    panel.reset_counters()
+    tft.send_rects(bytes((0, 0, 2, 2, 10, 10, 1, 1, 20, 20, 0, 5)), BLUE)
+    assert panel.transactions == 1
+    assert panel.commands[0x2C] == 2
+    assert lit(BLUE) == [(0, 0), (1, 0), (0, 1), (1, 1), (10, 10)]
+
+def test_window_cache():
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    panel.reset_counters()
+    # Same columns, then same rows: only the changed range is programmed
+    tft.send_rects(bytes((0, 0, 4, 1, 0, 2, 4, 1, 6, 2, 4, 1)), BLUE)
+    assert panel.commands[0x2A] == 2 and panel.commands[0x2B] == 2
+    assert len(lit(BLUE)) == 12
+    # Rotating invalidates the cache
+    tft.set_rotation(0)
+    panel.reset_counters()
+    tft.send_rects(bytes((6, 2, 4, 1)), RED)
+    assert panel.commands[0x2A] == 1 and panel.commands[0x2B] == 1
+
+def test_fill_chunks():
+    small = ST7735(dc=22, cs=21, rt=15, sck=18, mosi=19, miso=16, spi_port=0, cache_font=False, fill_chunk=7)
+    assert len(small._fill_buf) == 6
+    small.fill_screen(WHITE)
+    panel.reset_counters()
+    small.draw_rect(10, 20, 5, 3, BLUE)
+    small.draw_rect(10, 30, 1, 1, RED)
+    assert lit(BLUE) == [(x, y) for y in range(20, 23) for x in range(10, 15)]
+    assert lit(RED) == [(10, 30)]
+    assert panel.pixel_bytes == 32
+
+def test_rgb565_renderer_dirty_flush():
+    fb_tft = ST7735(dc=22, cs=21, rt=15, sck=18, mosi=19, miso=16, spi_port=0,
+                    renderer=RGB565FrameBufRenderer(80, 160, cache_font=False))
+    fb_tft.fill_screen(WHITE)
+    fb_tft.show()
+    assert len(lit(WHITE)) == 80 * 160
+
+    panel.reset_counters()
+    fb_tft.draw_rect(10, 10, 10, 10, RED)
+    fb_tft.draw_rect(20, 10, 10, 10, BLUE)
+    fb_tft.draw_rect(15, 12, 10, 2, RED)
+    fb_tft.draw_rect(60, 140, 2, 2, RED)
+    # Nothing is sent until show()
+    assert panel.pixel_bytes == 0
+    fb_tft.show()
+    # The neighbouring rects merge into one region, the distant one stays separate
+    assert panel.commands[0x2C] == 2
+    assert panel.pixel_bytes == (20 * 10 + 2 * 2) * 2
+    assert len(lit(BLUE)) == 100 - 10
+    assert len(lit(RED)) == 100 + 10 + 4
+
+def test_banded_renderer():
+    banded = BandedRenderer(80, 160, cache_font=False, band_height=16)
+    band_tft = ST7735(dc=22, cs=21, rt=15, sck=18, mosi=19, miso=16, spi_port=0, renderer=banded)
+    band_tft.fill_screen(WHITE)
+    band_tft.draw_rect(10, 10, 20, 20, RED)
+    band_tft.draw_rect(15, 15, 10, 10, BLUE)
+    panel.reset_counters()
+    band_tft.show()
+    assert panel.commands[0x2C] == 10
+    assert panel.pixel_bytes == 80 * 160 * 2
+    assert len(lit(BLUE)) == 100
+    assert len(lit(RED)) == 400 - 100
+    assert len(lit(WHITE)) == 80 * 160 - 400
+
+    # Only the bands under a new draw are sent, with earlier draws composited underneath
+    panel.reset_counters()
+    band_tft.draw_rect(20, 20, 20, 2, BLUE)
+    band_tft.show()
+    assert panel.commands[0x2C] == 1
+    assert panel.pixel_bytes == 80 * 16 * 2
+    assert len(lit(BLUE)) == 100 + 40 - 10
+
+def reference_pixels(draw):
+    import framebuf
+    buf = bytearray(10 * 160)
+    fb = framebuf.FrameBuffer(buf, 80, 160, framebuf.MONO_HLSB)
+    draw(fb)
+    return [(x, y) for y in range(160) for x in range(80) if fb.pixel(x, y)]
+
+def test_rasterized_shapes_match_framebuf():
+    tft.set_rotation(0)
+    coords = [18, 70, 33, 70, 40, 55, 47, 70, 62, 70, 51, 78, 58, 94, 40, 82, 22, 94, 29, 78]
+    tft.fill_screen(WHITE)
+    tft.draw_poly(5, 3, coords, BLUE)
+    assert lit(BLUE) == reference_pixels(lambda fb: fb.poly(5, 3, coords, 1, True))
+
+    tft.fill_screen(WHITE)
+    tft.draw_line(3, 150, 70, 2, BLUE)
+    assert lit(BLUE) == reference_pixels(lambda fb: fb.line(3, 150, 70, 2, 1))
+    tft.draw_line(0, 0, 79, 10, RED)
+    assert lit(RED) == reference_pixels(lambda fb: fb.line(0, 0, 79, 10, 1))
+
+    tft.fill_screen(WHITE)
+    tft.draw_text("Ag#~", 3, 30, BLUE)
+    assert lit(BLUE) == reference_pixels(lambda fb: fb.text("Ag#~", 3, 30, 1))
+
+def test_merge_runs():
+    # Two columns joined by a bar: the columns carry on through the bar, which only adds its gap
+    rows = [[(0, 1), (4, 5)], [(0, 1), (4, 5)], [(0, 5)], [(0, 1), (4, 5)]]
+    assert list(merge_runs(rows)) == [0, 0, 2, 4, 4, 0, 2, 4, 2, 2, 2, 1]
+    # Identical rows become one rect, and side-by-side rects over the same rows are joined
+    rows = [[(0, 1)], [(0, 3)], [(0, 3)]]
+    assert list(merge_runs(rows, 10, max_gaps=0)) == [0, 10, 2, 1, 0, 11, 4, 2]
+    assert list(merge_runs(rows, 10)) == [0, 10, 2, 3, 2, 11, 2, 2]
+
+def test_font_cache_file():
+    import os
+    import sys
+    import tempfile
+    built = tft.renderer
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "font.bin")
+        # Built and saved on first boot, loaded afterwards
+        first = MonoFrameBufRenderer(80, 160, True, path)
+        assert os.path.exists(path)
+        loaded = MonoFrameBufRenderer(80, 160, True, path)
+        assert bytes(loaded.font_cache) == bytes(first.font_cache) == bytes(built.font_cache)
+        assert list(loaded.font_cache_lookup) == list(built.font_cache_lookup)
+
+        built.save_font_cache(os.path.join(tmp, "font_cache_data.py"))
+        sys.path.insert(0, tmp)
+        try:
+            import font_cache_data
+        finally:
+            sys.path.remove(tmp)
+        frozen = MonoFrameBufRenderer(80, 160, True, font_cache_data)
+        assert frozen.font_cache == bytes(built.font_cache)
+        assert frozen.draw_text("Hi!", 3, 4) == built.draw_text("Hi!", 3, 4)
+
+def test_uncached_character_draws_alone():
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    tft.draw_text("a\x7fb", 0, 0, BLUE)
+    assert lit(BLUE) == reference_pixels(lambda fb: fb.text("a\x7fb", 0, 0, 1))
+
+def make_font(path):
+    import framebuf
+    from fonts import write_font
+    glyphs = {}
+    for code in list(range(33, 127)) + [0xB0, 0x20AC]:
+        scratch = bytearray(8)
+        fb = framebuf.FrameBuffer(scratch, 8, 8, framebuf.MONO_HLSB)
+        fb.text(chr(code) if code < 127 else "o", 0, 0, 1)
+        # Proportional: trim the glyph to its widest column plus one for spacing
+        width = max([x for y in range(8) for x in range(8) if fb.pixel(x, y)] + [0]) + 2
+        glyphs[code] = (width, bytes(scratch))
+    glyphs[32] = (3, bytes(8))
+    write_font(path, 8, glyphs)
+    return glyphs
+
+def test_bitmap_font():
+    import os
+    import tempfile
+    from fonts import BitmapFont
+    tft.set_rotation(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "font.bin")
+        glyphs = make_font(path)
+        font = BitmapFont(path, cache_size=256)
+        assert font.height == 8 and font.count == len(glyphs)
+        text = "Hi 20\u00b0C \u20ac"
+        assert font.text_width(text) == sum(glyphs[ord(ch)][0] for ch in text)
+
+        tft.fill_screen(WHITE)
+        tft.draw_text(text, 2, 5, BLUE, font=font)
+        def reference(fb):
+            x = 2
+            for ch in text:
+                width, bitmap = glyphs[ord(ch)]
+                for y in range(8):
+                    for gx in range(width):
+                        if bitmap[y] & (0x80 >> gx):
+                            fb.pixel(x + gx, 5 + y, 1)
+                x += width
+        assert lit(BLUE) == reference_pixels(reference)
+
+        # Missing characters fall back to the default glyph
+        assert font.char_width(0x1F600) == glyphs[ord("?")][0]
+        # The cache stays within its budget, evicting the least recently used glyphs
+        assert font.glyph_cache.size <= 256
+        misses = font.glyph_cache.misses
+        tft.draw_text("\u20ac", 0, 20, BLUE, font=font)
+        assert font.glyph_cache.misses == misses
+        font.close()
+
+def test_opaque_text():
+    import os
+    import tempfile
+    from fonts import BitmapFont
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    panel.reset_counters()
+    labels = len(tft.label_cache)
+    tft.draw_text("12:34", 3, 7, BLUE, bg=RED)
+    # The whole cell in one window write, without composing rects for the label cache
+    assert panel.commands[0x2C] == 1
+    assert len(tft.label_cache) == labels
+    assert panel.pixel_bytes == 40 * 8 * 2
+    text_px = reference_pixels(lambda fb: fb.text("12:34", 3, 7, 1))
+    assert lit(BLUE) == text_px
+    assert len(lit(RED)) == 40 * 8 - len(text_px)
+
+    # Clipped at the right edge
+    tft.fill_screen(WHITE)
+    tft.draw_text("ABCDEFGHIJK", 1, 0, BLUE, bg=RED)
+    assert len(lit(BLUE)) + len(lit(RED)) == 79 * 8
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "font.bin")
+        glyphs = make_font(path)
+        font = BitmapFont(path)
+        tft.fill_screen(WHITE)
+        tft.draw_text("Hi!", 5, 50, BLUE, font=font)
+        transparent = lit(BLUE)
+        tft.fill_screen(WHITE)
+        tft.draw_text("Hi!", 5, 50, BLUE, font=font, bg=RED)
+        assert lit(BLUE) == transparent
+        assert len(lit(RED)) == font.text_width("Hi!") * font.height - len(transparent)
+        font.close()
+
+    # A retained renderer takes the background and glyph rects
+    fb_tft = ST7735(dc=22, cs=21, rt=15, sck=18, mosi=19, miso=16, spi_port=0,
+                    renderer=RGB565FrameBufRenderer(80, 160))
+    fb_tft.fill_screen(WHITE)
+    fb_tft.draw_text("12:34", 3, 7, BLUE, bg=RED)
+    fb_tft.show()
+    assert lit(BLUE) == text_px
+    assert len(lit(RED)) == 40 * 8 - len(text_px)
+
+def test_scaled_text():
+    tft.set_rotation(0)
+    unscaled = reference_pixels(lambda fb: fb.text("7:0\x80", 0, 0, 1))
+    def draw_scaled(fb):
+        for x, y in unscaled:
+            fb.fill_rect(2 + x * 3, 5 + y * 3, 3, 3, 1)
+    expected = reference_pixels(draw_scaled)
+
+    tft.fill_screen(WHITE)
+    panel.reset_counters()
+    tft.draw_text("7:0\x80", 0, 0, BLUE)
+    unscaled_rects = panel.commands[0x2C]
+    tft.fill_screen(WHITE)
+    panel.reset_counters()
+    tft.draw_text("7:0\x80", 2, 5, BLUE, scale=3)
+    # The same rects, just bigger
+    assert panel.commands[0x2C] == unscaled_rects
+    assert lit(BLUE) == expected
+
+    # From a prescaled cache
+    tft.renderer.build_scaled_font_cache(3)
+    tft.fill_screen(WHITE)
+    tft.draw_text("7:0\x80", 2, 5, BLUE, scale=3)
+    assert lit(BLUE) == expected
+    tft.renderer.scaled_font_caches.clear()
+
+    # Opaque, clipped at the right edge
+    tft.fill_screen(WHITE)
+    panel.reset_counters()
+    tft.draw_text("7:0\x80", 2, 5, BLUE, bg=RED, scale=3)
+    assert panel.commands[0x2C] == 1
+    assert lit(BLUE) == expected
+    assert len(lit(RED)) == 78 * 24 - len(expected)
+
+def test_label_cache():
+    tft.set_rotation(0)
+    cache = tft.label_cache
+    cache.clear()
+    hits = cache.hits
+    misses = cache.misses
+    tft.fill_screen(WHITE)
+    tft.draw_text("RPM", 4, 10, BLUE)
+    tft.draw_text("RPM", 30, 100, BLUE)
+    expected = reference_pixels(lambda fb: (fb.text("RPM", 4, 10, 1), fb.text("RPM", 30, 100, 1)))
+    assert lit(BLUE) == expected
+    # Another scale is another entry
+    tft.draw_text("RPM", 4, 10, BLUE, scale=2)
+    assert cache.hits - hits == 1
+    assert cache.misses - misses == 2
+    assert len(cache) == 2
+
+    # A cached label that doesn't fit at the new position is drawn clipped as before
+    tft.fill_screen(WHITE)
+    tft.draw_text("ABCDEFGHIJ", 0, 0, BLUE)
+    tft.fill_screen(WHITE)
+    tft.draw_text("ABCDEFGHIJ", 20, 0, BLUE)
+    assert lit(BLUE) == reference_pixels(lambda fb: fb.text("ABCDEFGHIJ", 20, 0, 1))
+
+    # Through a retained renderer too
+    fb_tft = ST7735(dc=22, cs=21, rt=15, sck=18, mosi=19, miso=16, spi_port=0,
+                    renderer=RGB565FrameBufRenderer(80, 160))
+    fb_tft.fill_screen(WHITE)
+    fb_tft.draw_text("RPM", 4, 10, BLUE)
+    fb_tft.draw_text("RPM", 30, 100, BLUE)
+    fb_tft.show()
+    assert fb_tft.label_cache.hits == 1
+    assert lit(BLUE) == expected
+
+    # Cached labels moved partly off each edge are clipped, with both kinds of renderer
+    transparent = ((-5, 20), (60, 30), (10, 155))
+    opaque = ((-5, 60), (60, 70), (10, -3))
+    def draw_off_edges(t):
+        t.fill_screen(WHITE)
+        for x, y in transparent:
+            t.draw_text("RPM", x, y, BLUE)
+        for x, y in opaque:
+            t.draw_text("RPM", x, y, BLUE, bg=RED)
+        t.show()
+    expected = reference_pixels(lambda fb: [fb.text("RPM", x, y, 1) for x, y in transparent + opaque])
+    cells = set((cx, cy) for x, y in opaque for cx in range(max(x, 0), min(x + 24, 80)) for cy in range(max(y, 0), y + 8))
+    for t in (tft, fb_tft):
+        # Both drivers share the panel, so the window the other one left programmed is unknown
+        t.invalidate_window()
+        draw_off_edges(t)
+        assert lit(BLUE) == expected
+        assert set(lit(RED)) == cells - set(expected)
+
+    # Without the cache the driver doesn't need fonts.py
+    import subprocess
+    import sys
+    script = ("import sys, emulator; emulator.install(dc=22, cs=21, rt=15, spi_port=0); sys.modules['fonts'] = None; "
+              "from ST7735 import ST7735; ST7735(dc=22, cs=21, rt=15, sck=18, mosi=19, miso=16, spi_port=0, label_cache_size=0)")
+    assert subprocess.run([sys.executable, "-W", "ignore", "-c", script]).returncode == 0
+
+def test_text_leaves_font_cache_intact():
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    tft.draw_text("ll", 0, 0, BLUE)
+    left = [p for p in lit(BLUE) if p[0] < 8]
+    right = [(x - 8, y) for x, y in lit(BLUE) if x >= 8]
+    assert left and left == right
+
+def test_rotation():
+    tft.set_rotation(1)
+    assert panel.madctl == 0x6C
+    assert (panel.width, panel.height) == (tft.width, tft.height) == (160, 80)
+    tft.fill_screen(WHITE)
+    tft.draw_rect(150, 70, 10, 10, RED)
+    assert len(lit(RED)) == 100
+    tft.set_rotation(0)
+    assert panel.madctl == 0x08
+
+def test_console_scrolls():
+    from console import Console
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    console = Console(tft, BLUE, RED, top=16, height=40)
+    assert console.rows == 5
+    for i in range(5):
+        console.write(f"line {i}")
+    assert panel.scroll_start == 16
+
+    # Each line after the area is full is one row of text and a scroll
+    panel.reset_counters()
+    console.write("line 5\nline 6")
+    assert panel.pixel_bytes == 2 * 80 * 8 * 2
+    assert panel.commands[0x37] == 2
+    expected = reference_pixels(lambda fb: [fb.text(f"line {i + 2}", 0, 16 + i * 8, 1) for i in range(5)])
+    assert lit(BLUE) == expected
+    # The fixed rows are untouched
+    assert all(panel.pixel(x, y) == 0xFFFF for y in list(range(16)) + list(range(56, 160)) for x in range(80))
+
+    console.close()
+    assert not panel.scrolling
+    try:
+        tft.set_rotation(1)
+        Console(tft, BLUE, RED)
+        assert False, "scrolling in landscape"
+    except ValueError:
+        pass
+    tft.set_rotation(0)
+
+def test_power_modes():
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    tft.set_partial(40, 20)
+    assert panel.partial and panel.partial_rows == (40, 59)
+    assert panel.pixel(0, 40) == 0xFFFF and panel.pixel(0, 59) == 0xFFFF
+    assert panel.pixel(0, 39) == 0 and panel.pixel(0, 60) == 0
+    # Rotating leaves partial mode
+    tft.set_rotation(1)
+    assert not panel.partial and tft.partial_rows is None
+    tft.set_rotation(0)
+
+    tft.set_partial(0, 16)
+    tft.normal_mode()
+    assert not panel.partial
+
+    tft.fill_screen(b'\x7B\xEF')
+    tft.set_idle(True)
+    assert panel.pixel(5, 5) == 0
+    tft.set_idle(False)
+    assert panel.pixel(5, 5) == 0x7BEF
+
+    # Drawing while asleep lands once awake, with the window and rotation still right
+    tft.set_rotation(1)
+    tft.sleep()
+    assert panel.sleeping
+    tft.fill_screen(WHITE)
+    tft.draw_rect(150, 70, 10, 10, RED)
+    tft.wake()
+    tft.sleep()
+    tft.wake()
+    assert not panel.sleeping
+    assert panel.sleep_violations == 0
+    assert panel.madctl == 0x6C
+    tft.draw_rect(0, 0, 10, 10, RED)
+    assert len(lit(RED)) == 200
+
+    # Reinitializing keeps the rotation the driver is drawing in, and sleeping straight after it
+    # waits for the SLPOUT it sent
+    tft.tft_initialize()
+    tft.sleep()
+    tft.wake()
+    assert panel.sleep_violations == 0
+    assert panel.madctl == 0x6C and tft.width == 160
+    tft.fill_screen(WHITE)
+    tft.draw_rect(150, 70, 10, 10, RED)
+    assert len(lit(RED)) == 100 and panel.pixel(159, 79) == 0xF800
+    tft.set_rotation(0)
+
+def test_scene_redraws_damage():
+    from scene import Scene, RectNode, TextNode, EllipseNode, PolyNode
+    tft.set_rotation(0)
+
+    def build():
+        scene = Scene(tft, WHITE)
+        scene.add(RectNode(0, 0, 80, 20, BLUE))
+        value = scene.add(TextNode("12", 10, 6, WHITE, bg=RED))
+        dot = scene.add(EllipseNode(40, 80, 10, 10, RED))
+        scene.add(PolyNode(0, 0, [30, 70, 50, 70, 40, 95], BLUE))
+        return scene, value, dot
+
+    scene, value, dot = build()
+    scene.render()
+    panel.reset_counters()
+    value.set(text="345")
+    dot.set(x=50, y=120)
+    scene.render()
+    # Only the text and the ellipse's old and new areas were sent
+    assert panel.pixel_bytes < 80 * 160 * 2 // 4
+    incremental = panel.image()
+
+    scene, value, dot = build()
+    value.set(text="345")
+    dot.set(x=50, y=120)
+    scene.render()
+    assert panel.image() == incremental
+
+    # Hiding a node uncovers what was under it
+    dot.set(visible=False)
+    scene.render()
+    assert lit(RED) and all(y < 20 for x, y in lit(RED))
+
+    # Opaque text running off the screen has its background clipped
+    value.set(text="x" * 12, x=0, y=140, scale=3)
+    scene.render()
+    assert all(y >= 140 and x < 80 for x, y in lit(RED))
+    assert any(x == 79 for x, y in lit(RED))
+    # Moved off each edge of the screen
+    for x, y in ((100, 10), (10, 170), (-40, 30), (10, -20)):
+        value.set(text="12", x=x, y=y, scale=1)
+        scene.render()
+        assert all(y < 20 for x, y in lit(RED))
+    # Partly off the top left, the visible part covers the blue rect under it
+    value.set(x=-8, y=-4)
+    scene.render()
+    assert all(panel.pixel(x, y) in (0xF800, 0xFFFF) for x in range(8) for y in range(4))
+    assert panel.pixel(8, 0) == 0x001F and panel.pixel(0, 4) == 0x001F
+
+def test_async_pipeline():
+    import asyncio
+    from ST7735_async import AsyncST7735
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    tft.draw_ellipse(40, 80, 30, 60, RED)
+    tft.draw_text("async", 10, 10, BLUE, bg=WHITE)
+    tft.draw_line(0, 0, 79, 159, BLUE)
+    expected = panel.image()
+    tft.fill_screen(RED)
+
+    async def main():
+        display = AsyncST7735(tft, max_queue=2, batch_rects=4)
+        display.start()
+        polls = []
+        async def sensor():
+            while True:
+                polls.append(len(display.queue))
+                await asyncio.sleep(0)
+        sensor_task = asyncio.create_task(sensor())
+        await display.fill_screen(WHITE)
+        await display.draw_ellipse(40, 80, 30, 60, RED)
+        await display.draw_text("async", 10, 10, BLUE, bg=WHITE)
+        await display.draw_line(0, 0, 79, 159, BLUE)
+        await display.stop()
+        sensor_task.cancel()
+        return polls
+
+    polls = asyncio.run(main())
+    # Other tasks ran while drawing, and the queue never went past its bound
+    assert len(polls) > 10
+    assert max(polls) <= 2
+    assert panel.image() == expected
+
+    # Opaque text off the edges is clipped as by the driver
+    labels = ((-5, 20), (60, 30), (10, -3), (90, 40))
+    tft.fill_screen(WHITE)
+    for x, y in labels:
+        tft.draw_text("RPM", x, y, BLUE, bg=RED)
+    expected = panel.image()
+    tft.fill_screen(WHITE)
+
+    async def off_edges():
+        display = AsyncST7735(tft)
+        display.start()
+        for x, y in labels:
+            await display.draw_text("RPM", x, y, BLUE, bg=RED)
+        await display.stop()
+
+    asyncio.run(off_edges())
+    assert panel.image() == expected
+
+def test_dual_core_pipeline():
+    import _thread
+    from ST7735_dual import DualCoreST7735
+    tft.set_rotation(0)
+
+    def draw(t):
+        t.fill_screen(WHITE)
+        t.draw_ellipse(40, 80, 30, 60, RED)
+        t.draw_text("dual", 10, 10, BLUE, bg=WHITE)
+        t.draw_poly(0, 0, [18, 70, 33, 70, 40, 55, 47, 70, 62, 70], BLUE)
+        for i in range(10):
+            t.draw_line(0, i * 16, 79, 159 - i * 16, BLUE)
+
+    draw(tft)
+    expected = panel.image()
+    tft.fill_screen(RED)
+
+    renderer = tft.renderer
+    threads = set()
+    def draw_line(*args):
+        threads.add(_thread.get_ident())
+        return MonoFrameBufRenderer.draw_line(renderer, *args)
+    renderer.draw_line = draw_line
+    display = DualCoreST7735(tft)
+    try:
+        draw(display)
+        display.flush()
+        assert panel.image() == expected
+        # A second frame reuses the thread
+        draw(display)
+        display.flush()
+        assert panel.image() == expected
+
+        # A draw that fails to render ends the frame with its exception instead of hanging
+        display.fill_screen(RED)
+        display.draw_poly(0, 0, [], BLUE)
+        display.draw_rect(0, 0, 10, 10, BLUE)
+        try:
+            display.flush()
+            assert False, "flush didn't raise"
+        except ValueError:
+            pass
+        # So does one that fails to send, and the next frame still draws
+        sent = []
+        def draw_rects(*args):
+            sent.append(args)
+            raise OSError("SPI")
+        tft.draw_rects = draw_rects
+        try:
+            draw(display)
+            display.flush()
+            assert False, "flush didn't raise"
+        except OSError:
+            pass
+        finally:
+            del tft.draw_rects
+        assert len(sent) == 1
+        draw(display)
+        display.flush()
+        assert panel.image() == expected
+    finally:
+        display.stop()
+        del renderer.draw_line
+    assert threads and _thread.get_ident() not in threads
+
+def test_xml_reader_chunks():
+    from io import StringIO
+    from svg import SimpleXMLReader
+    text = """<?xml version="1.0"?>
+<svg width="160" height="80">
+  <!-- a comment with <rect x="1"/> and > in it -->
+  <desc>Text is skipped</desc>
+  <rect x='5' y="6" title="a > b" hidden />
+  <circle/>
+  <polygon points="0,0 10,0 5,8" FILL="red"></polygon>
+</svg>"""
+    expected = [
+        ("svg", {"width": "160", "height": "80"}),
+        ("desc", {}),
+        ("rect", {"x": "5", "y": "6", "title": "a > b", "hidden": True}),
+        ("circle", {}),
+        ("polygon", {"points": "0,0 10,0 5,8", "fill": "red"}),
+    ]
+    for chunk_size in (1, 3, 16, 4096):
+        reader = SimpleXMLReader(chunk_size)
+        elements = [(e.name, e.attributes) for e in reader.iter_elements(StringIO(text))]
+        assert elements == expected, chunk_size
+
+def test_svg_stream():
+    import tracemalloc
+    from io import StringIO
+    from svg import SVG
+    tft.set_rotation(1)
+    with open("test.svg") as f:
+        text = f.read()
+    tft.fill_screen(WHITE)
+    tft.draw_svg(SVG.read_svg(StringIO(text)))
+    expected = panel.image()
+    tft.fill_screen(WHITE)
+    tft.draw_svg_stream(StringIO(text))
+    assert panel.image() == expected
+    tft.set_rotation(0)
+
+    # A long file generated as it is read
+    class ShapeStream:
+        def __init__(self, count):
+            self.shapes = (f'<rect x="{i % 60}" y="{i % 140}" width="20" height="20" fill="#{i % 256:02x}0000"/>\n' for i in range(count))
+            self.buf = "<svg>"
+            self.drawn_before_end = False
+        def read(self, n):
+            while len(self.buf) < n:
+                shape = next(self.shapes, None)
+                if shape is None:
+                    break
+                self.buf += shape
+            if panel.commands.get(0x2C, 0) > 0 and self.buf:
+                self.drawn_before_end = True
+            chunk, self.buf = self.buf[:n], self.buf[n:]
+            return chunk
+
+    peaks = []
+    for count in (100, 1000):
+        stream = ShapeStream(count)
+        panel.reset_counters()
+        tracemalloc.start()
+        tft.draw_svg_stream(stream)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert panel.commands[0x2C] == count
+        assert stream.drawn_before_end
+    # Memory doesn't grow with the length of the file
+    assert peaks[1] < peaks[0] * 1.5
+
+def test_cached_svg_player():
+    from svg import SVG
+    tft.set_rotation(1)
+    with open("test.svg") as f:
+        svg = SVG.read_svg(f)
+    tft.fill_screen(WHITE)
+    tft.draw_svg(svg)
+    expected = panel.image()
+
+    cached = tft.create_cached_svg(svg)
+    tft.fill_screen(WHITE)
+    panel.reset_counters()
+    tft.draw_cached_svg(cached)
+    assert panel.image() == expected
+    # One transaction per colour run
+    assert panel.transactions == len(list(cached.runs()))
+
+    tft.fill_screen(WHITE)
+    tft.draw_cached_svg(cached, 3, 2)
+    moved = panel.image()
+    assert all(moved[(y + 2) * 160 + x + 3] == expected[y * 160 + x] for y in range(78) for x in range(157))
+    tft.set_rotation(0)
+
+def test_cached_svg_file():
+    import os
+    import tempfile
+    from svg import CachedSVG, play_cached_svg
+    tft.set_rotation(0)
+    cached = CachedSVG()
+    for i in range(300):
+        cached.add_rect(i % 70, i // 2, 10, 1, RED)
+    cached.add_rect(20, 40, 30, 30, BLUE)
+    cached.add_rect(60, 150, 40, 40, RED)
+    cached.finish_caching()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "icon.svgc")
+        cached.save(path)
+        # 4 magic, then runs of 255 + 45 red, 1 blue, 1 red rects with a 4 byte header each
+        assert os.path.getsize(path) == 4 + 4 * 4 + 302 * 8
+        # Little endian whatever the host
+        with open(path, "rb") as f:
+            assert f.read(16) == b'STSV\xF8\x00\xFF\x00\x00\x00\x00\x00\x0A\x00\x01\x00'
+        loaded = CachedSVG.load(path)
+        assert bytes(loaded.rects) == bytes(cached.rects)
+
+        tft.fill_screen(WHITE)
+        for c, rects in cached.runs():
+            tft.draw_rects(rects, c, 5, 0)
+        expected = panel.image()
+        tft.fill_screen(WHITE)
+        # Chunks smaller than a run, and the last rect clipped at the screen edge
+        play_cached_svg(path, tft, 5, 0, chunk_rects=16)
+        assert panel.image() == expected
+
+        with open(path, "r+b") as f:
+            f.write(b'XXXX')
+        try:
+            CachedSVG.load(path)
+            assert False, "loaded a file with a bad magic"
+        except ValueError:
+            pass
+
+def test_svg_path():
+    from io import StringIO
+    from svg import SVG
+    tft.set_rotation(0)
+    # Absolute and relative forms of the same square
+    assert SVG.parse_path("M10 10 H30 V30 H10 Z") == SVG.parse_path("m10,10h20v20h-20z")
+    subpaths = SVG.parse_path("M0 0 L4 0 4 4 M10 10 l1-1")
+    assert subpaths == [([0, 0, 4, 0, 4, 4], False), ([10, 10, 11, 9], False)]
+
+    # Flattening adapts to size: a small circle needs far fewer points than a big one
+    small = SVG.parse_path("M0 2 A2 2 0 1 0 4 2 A2 2 0 1 0 0 2 Z")[0][0]
+    big = SVG.parse_path("M0 60 A60 60 0 1 0 120 60 A60 60 0 1 0 0 60 Z")[0][0]
+    assert len(small) < len(big) <= 200
+    # Every flattened point of a curve lies on it
+    for i in range(0, len(big), 2):
+        assert abs(((big[i] - 60) ** 2 + (big[i + 1] - 60) ** 2) ** 0.5 - 60) < 0.01
+    quad = SVG.parse_path("M0 0 Q20 40 40 0 T80 0")[0][0]
+    assert quad[-2:] == [80, 0] and 6 < len(quad) < 60
+    cubic = SVG.parse_path("M0 0 C0 20 20 20 20 0 S40 -20 40 0")[0][0]
+    assert cubic[-2:] == [40, 0] and max(cubic[1::2]) <= 15
+
+    # A filled square with a square hole, and a stroked triangle
+    text = """<svg>
+    <path d="M10 10 h40 v40 h-40 z M20 20 h20 v20 h-20 z" fill="#ff0000"/>
+    <path d="M55 60 L75 80 L55 80 Z" stroke="#0000ff"/>
+    </svg>"""
+    tft.fill_screen(WHITE)
+    tft.draw_svg(SVG.read_svg(StringIO(text)))
+    red = set(lit(RED))
+    assert (10, 10) in red and (50, 50) in red and (15, 30) in red
+    assert (30, 30) not in red and (25, 25) not in red
+    assert all(10 <= x <= 50 and 10 <= y <= 50 for x, y in red)
+    blue = set(lit(BLUE))
+    assert (55, 60) in blue and (75, 80) in blue and (65, 80) in blue and (65, 70) in blue and (55, 70) in blue
+    assert (60, 75) not in blue
+    expected = panel.image()
+
+    # Subpaths that share an edge fill like one shape, without a seam where they meet
+    tft.fill_screen(WHITE)
+    tft.draw_svg(SVG.read_svg(StringIO('<svg><path d="M10 60 h20 v10 h-20 z" fill="#ff0000"/></svg>')))
+    whole = lit(RED)
+    tft.fill_screen(WHITE)
+    tft.draw_svg(SVG.read_svg(StringIO('<svg><path d="M10 60 h10 v10 h-10 z M20 60 h10 v10 h-10 z" fill="#ff0000"/></svg>')))
+    assert lit(RED) == whole
+    tft.fill_screen(WHITE)
+    tft.draw_svg(SVG.read_svg(StringIO(text)))
+
+    # Paths go through the cache like any other shape
+    cached = tft.create_cached_svg(SVG.read_svg(StringIO(text)))
+    tft.fill_screen(WHITE)
+    tft.draw_cached_svg(cached)
+    assert panel.image() == expected
+
+def test_svg_transforms():
+    from io import StringIO
+    from svg import SVG, SimpleXMLReader
+    names = [e.name for e in SimpleXMLReader(end_tags=True).get_all_elements(StringIO('<svg><g><rect/></g><g/></svg>'))]
+    assert names == ["svg", "g", "rect", "/g", "g", "/svg"]
+
+    # A 20x10 viewBox fitted to 80x80: scaled by 4 and centred vertically
+    text = """<svg viewBox="10 0 20 10" width="80" height="80">
+    <g transform="translate(2 1)">
+      <rect x="8" y="-1" width="5" height="2.5" fill="#ff0000"/>
+      <circle cx="12" cy="4" r="1" transform="scale(2 1)" fill="#0000ff"/>
+    </g>
+    <line x1="10" y1="0" x2="30" y2="10" stroke="#0000ff" transform="matrix(1 0 0 1 0 0)"/>
+    </svg>"""
+    rect, ellipse, line = SVG.read_svg(StringIO(text)).shapes
+    assert [rect.attributes[a] for a in ("x", "y", "width", "height")] == [0, 20, 20, 10]
+    assert ellipse.name == "ellipse"
+    assert [ellipse.attributes[a] for a in ("cx", "cy", "rx", "ry")] == [64, 40, 8, 4]
+    assert [line.attributes[a] for a in ("x1", "y1", "x2", "y2")] == [0, 20, 80, 60]
+    # Fitted to another size instead, and stretched with preserveAspectRatio="none"
+    rect = SVG.read_svg(StringIO(text), 40, 40).shapes[0]
+    assert [rect.attributes[a] for a in ("x", "y", "width", "height")] == [0, 10, 10, 5]
+    stretched = text.replace('width="80"', 'preserveAspectRatio="none" width="80"')
+    rect = SVG.read_svg(StringIO(stretched)).shapes[0]
+    assert [rect.attributes[a] for a in ("x", "y", "width", "height")] == [0, 0, 20, 20]
+    # Units are kept as fractions until the end, 10mm is 37.8px
+    rect = SVG.read_svg(StringIO('<svg><rect x="0" y="0" width="10mm" height="1" fill="red"/></svg>')).shapes[0]
+    assert rect.attributes['width'] == 38
+
+    # A rotated square becomes a path, drawn as a diamond
+    text = """<svg>
+    <rect x="-10" y="-10" width="20" height="20" fill="#ff0000" transform="translate(40 40) rotate(45)"/>
+    </svg>"""
+    shape = SVG.read_svg(StringIO(text)).shapes[0]
+    assert shape.name == "path"
+    tft.set_rotation(0)
+    tft.fill_screen(WHITE)
+    tft.draw_svg(SVG.read_svg(StringIO(text)))
+    red = set(lit(RED))
+    assert (40, 40) in red and (40, 27) in red and (27, 40) in red
+    assert (30, 30) not in red and (50, 50) not in red
+    assert all(abs(x - 40) + abs(y - 40) <= 15 for x, y in red)
+
+def test_svg_offscreen():
+    from io import StringIO
+    tft.set_rotation(1)
+    # Sliced to fill the 160x80 screen, so the square hangs off the top and bottom
+    tft.fill_screen(WHITE)
+    tft.draw_svg_stream(StringIO('''<svg viewBox="0 0 100 100" preserveAspectRatio="xMidYMid slice" width="160" height="80">
+    <rect x="0" y="0" width="100" height="100" fill="red"/>
+    <rect x="10" y="10" width="80" height="80" stroke="#0000ff" stroke-width="1"/>
+    </svg>'''))
+    assert len(lit(RED)) + len(lit(BLUE)) == 160 * 80
+    # Only the sides of the outline are on screen, scaled to 2px
+    assert sorted(lit(BLUE)) == [(x, y) for x in (15, 16, 143, 144) for y in range(80)]
+    # Moved partly and entirely off the left
+    tft.fill_screen(WHITE)
+    tft.draw_svg_stream(StringIO('''<svg><g transform="translate(-5 0)">
+    <rect x="0" y="0" width="10" height="10" fill="red"/>
+    <rect x="-20" y="20" width="10" height="10" fill="red" stroke="#0000ff" stroke-width="1"/>
+    </g></svg>'''))
+    assert sorted(lit(RED)) == [(x, y) for x in range(5) for y in range(10)]
+    assert lit(BLUE) == []
+    tft.set_rotation(0)
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,234 @@
+# Benchmarks for the drawing primitives, run on the host against the emulated panel.
+#
+#     python bench.py                       run and print the results
+#     python bench.py --output results.json write the results as JSON
+#     python bench.py --check               fail if any case is slower than bench_baseline.json
+#     python bench.py --update-baseline     record the current results as the baseline
+#
+# The timings compared are modelled from the traffic the panel saw (see Panel.modelled_time), so
+# they are deterministic and don't depend on how fast the host is. Cases that send nothing to the
+# panel, such as parse_svg, are compared on peak allocation instead.
+import gc
+import sys
+import json
+import random
+import tracemalloc
+from time import perf_counter
+
+import emulator
+panel = emulator.install(dc=22, cs=21, rt=15, spi_port=0)
+
+from ST7735 import ST7735
+from svg import SVG, SimpleXMLReader
+
+BAUD = 62_500_000
+BASELINE_FILE = "bench_baseline.json"
+# Allowed slowdown against the baseline before --check fails
+TOLERANCE = 0.02
+# Allowed growth in peak allocation for cases without panel traffic. tracemalloc varies a little
+# from run to run, so this is looser.
+ALLOC_TOLERANCE = 0.05
+
+WHITE = b'\xFF\xFF'
+BLACK = b'\x00\x00'
+RED = b'\xF8\x00'
+
+def new_tft():
+    tft = ST7735(dc=22, cs=21, rt=15, sck=18, mosi=19, miso=16, spi_port=0, baud=BAUD)
+    tft.tft_initialize()
+    return tft
+
+def bench_fill_screen(tft):
+    for c in (WHITE, BLACK, RED):
+        tft.fill_screen(c)
+
+def bench_draw_text(tft):
+    for r in range(11):
+        text = "".join([chr(ci) for ci in range(33 + (r * 9), 42 + (r * 9))])
+        tft.draw_text(text, 5, r * 8 + 5, BLACK)
+
+def bench_draw_line(tft):
+    rand = random.Random(7735)
+    for _ in range(20):
+        tft.draw_line(0, rand.randint(0, 159), 79, rand.randint(0, 159), RED)
+
+def bench_draw_poly(tft):
+    tft.draw_poly(0, 0, [18, 70, 33, 70, 40, 55, 47, 70, 62, 70, 51, 78, 58, 94, 40, 82, 22, 94, 29, 78], RED, True, False)
+
+def bench_draw_ellipse(tft):
+    tft.draw_ellipse(40, 40, 37, 37, RED, fill=False)
+    tft.draw_ellipse(40, 120, 37, 37, RED)
+
+def bench_draw_rect_outline(tft):
+    for t in range(1, 11):
+        tft.draw_rect(5, 5, 70, 150, BLACK, False, t)
+
+def bench_console(tft):
+    from console import Console
+    console = Console(tft, WHITE, BLACK)
+    for i in range(40):
+        console.write(f"{i:3} log line")
+
+def setup_scene(tft):
+    from scene import Scene, RectNode, TextNode, EllipseNode
+    scene = Scene(tft, BLACK)
+    scene.add(RectNode(0, 0, 80, 24, RED))
+    for i in range(6):
+        scene.add(EllipseNode(20 + (i % 3) * 20, 50 + (i // 3) * 30, 9, 9, WHITE))
+    value = scene.add(TextNode("0", 4, 130, WHITE))
+    scene.render()
+    return scene, value
+
+def bench_scene_update(tft, setup):
+    scene, value = setup
+    for i in range(10):
+        value.set(text=str(i * 7))
+        scene.render()
+
+def load_svg():
+    with open("test.svg") as f:
+        return SVG.read_svg(f)
+
+def setup_parse_svg(tft):
+    rows = [f'  <rect x="{i % 70}" y="{i // 2}" width="10" height="4" fill="#{i * 2:02x}80ff" stroke="none"/>' for i in range(150)]
+    return '<svg width="80" height="160" xmlns="http://www.w3.org/2000/svg">\n' + "\n".join(rows) + "\n</svg>"
+
+def bench_parse_svg(tft, text):
+    from io import StringIO
+    SVG.read_svg(StringIO(text))
+
+# Streaming the same document one element at a time, without keeping the elements
+def bench_stream_svg(tft, text):
+    from io import StringIO
+    for _ in SimpleXMLReader().iter_elements(StringIO(text)):
+        pass
+
+def setup_svg_path(tft):
+    from io import StringIO
+    text = """<svg width="80" height="160">
+  <path d="M10 40 C10 10 70 10 70 40 S10 70 10 100 Q40 130 70 100 Z" fill="#ff8000"/>
+  <path d="M40 140 a20 12 0 1 0 0.1 0 z m-8 0 h16" stroke="#0000ff"/>
+</svg>"""
+    return SVG.read_svg(StringIO(text))
+
+def bench_svg_path(tft, svg):
+    tft.draw_svg(svg)
+
+def bench_draw_svg(tft):
+    tft.set_rotation(1)
+    tft.draw_svg(load_svg())
+
+def setup_cached_svg(tft):
+    tft.set_rotation(1)
+    return tft.create_cached_svg(load_svg())
+
+def bench_draw_cached_svg(tft, cached):
+    tft.draw_cached_svg(cached)
+
+# (name, setup, run). setup runs before measuring and its result is passed to run.
+CASES = (
+    ("fill_screen", None, bench_fill_screen),
+    ("draw_text", None, bench_draw_text),
+    ("draw_line", None, bench_draw_line),
+    ("draw_poly", None, bench_draw_poly),
+    ("draw_ellipse", None, bench_draw_ellipse),
+    ("draw_rect_outline", None, bench_draw_rect_outline),
+    ("console", None, bench_console),
+    ("scene_update", setup_scene, bench_scene_update),
+    ("parse_svg", setup_parse_svg, bench_parse_svg),
+    ("stream_svg", setup_parse_svg, bench_stream_svg),
+    ("svg_path", setup_svg_path, bench_svg_path),
+    ("draw_svg", None, bench_draw_svg),
+    ("draw_cached_svg", setup_cached_svg, bench_draw_cached_svg),
+)
+
+def run_case(setup, run):
+    tft = new_tft()
+    args = ()
+    if setup is not None:
+        args = (setup(tft),)
+    panel.reset_counters()
+    # Start from a clean heap so peak_alloc doesn't depend on when the collector last ran
+    gc.collect()
+    tracemalloc.start()
+    start = perf_counter()
+    run(tft, *args)
+    host_time = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    overhead_bytes = panel.command_bytes + panel.data_bytes - panel.pixel_bytes
+    return {
+        "rects": panel.commands.get(0x2C, 0),
+        "command_bytes": overhead_bytes,
+        "pixel_bytes": panel.pixel_bytes,
+        "writes": panel.writes,
+        "transactions": panel.transactions,
+        "cs_toggles": panel.cs_toggles,
+        "dc_toggles": panel.dc_toggles,
+        "peak_alloc": peak,
+        "modelled_ms": round(panel.modelled_time(BAUD) * 1000, 4),
+        "host_ms": round(host_time * 1000, 2),
+    }
+
+def run_all(names=None):
+    results = {}
+    for name, setup, run in CASES:
+        if names and name not in names:
+            continue
+        results[name] = run_case(setup, run)
+    return results
+
+def print_results(results):
+    columns = ("rects", "command_bytes", "pixel_bytes", "transactions", "peak_alloc", "modelled_ms", "host_ms")
+    print(f"{'case':<20}" + "".join(f"{c:>15}" for c in columns))
+    for name, r in results.items():
+        print(f"{name:<20}" + "".join(f"{r[c]:>15}" for c in columns))
+
+# Cases that got worse than the baseline, as (name, baseline, current, unit). Cases that send
+# nothing to the panel are compared on peak allocation, the rest on modelled time.
+def find_regressions(results, baseline, tolerance=TOLERANCE, alloc_tolerance=ALLOC_TOLERANCE):
+    regressions = []
+    for name, r in results.items():
+        base = baseline[name]
+        if base["modelled_ms"] == 0:
+            if r["peak_alloc"] > base["peak_alloc"] * (1 + alloc_tolerance):
+                regressions.append((name, base["peak_alloc"], r["peak_alloc"], "bytes"))
+        elif r["modelled_ms"] > base["modelled_ms"] * (1 + tolerance):
+            regressions.append((name, base["modelled_ms"], r["modelled_ms"], "ms"))
+    return regressions
+
+def main(argv):
+    output = None
+    if "--output" in argv:
+        output = argv[argv.index("--output") + 1]
+    results = run_all()
+    print_results(results)
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if "--update-baseline" in argv:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {BASELINE_FILE}")
+    elif "--check" in argv:
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+        # A case without a baseline can't be checked, so it fails until the baseline is updated
+        missing = [name for name in results if name not in baseline]
+        for name in missing:
+            print(f"NO BASELINE {name}: run with --update-baseline")
+        if missing:
+            return 1
+        regressions = find_regressions(results, baseline)
+        for name, before, after, unit in regressions:
+            print(f"REGRESSION {name}: {before} {unit} -> {after} {unit}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
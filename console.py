@@ -0,0 +1,63 @@
+# Scrolling text console using the panel's hardware vertical scrolling. A new line is drawn over
+# the oldest one and the scroll start moved down a line, so only one text row is sent per line
+# instead of redrawing the whole screen. Lines longer than the screen width are clipped.
+class Console:
+    # Uses rows top to top + height - 1 (to the bottom of the screen if height is None), rounded
+    # down to whole lines. Only works in rotation 0, see ST7735.set_scroll_region.
+    def __init__(self, tft, fg: bytes, bg: bytes, top=0, height=None, font=None, scale=1):
+        self.tft = tft
+        self.fg = fg
+        self.bg = bg
+        self.font = font
+        self.scale = scale
+        self.line_height = (8 if font is None else font.height) * scale
+        if height is None:
+            height = tft.height - top
+        self.rows = height // self.line_height
+        if self.rows == 0:
+            raise ValueError("Console too short for a line of text")
+        self.top = top
+        self.height = self.rows * self.line_height
+        tft.set_scroll_region(top, self.height)
+        self.clear()
+
+    def clear(self):
+        self.tft.draw_rect(0, self.top, self.tft.width, self.height, self.bg)
+        self.tft.show()
+        self.tft.scroll_to(0)
+        # Lines written so far, up to rows, and the offset of the oldest line in the scroll area
+        self.lines = 0
+        self.offset = 0
+
+    # Append a line, or a line for each \n separated part of text
+    def write(self, text):
+        for line in text.split("\n"):
+            self._append(line)
+
+    def _append(self, text):
+        tft = self.tft
+        if self.lines < self.rows:
+            # Still filling the area, no scrolling yet
+            y = self.top + self.lines * self.line_height
+            self.lines += 1
+            self._draw_line(text, y)
+            tft.show()
+            return
+        # Overwrite the oldest line, then scroll it round to the bottom
+        self._draw_line(text, self.top + self.offset)
+        self.offset = (self.offset + self.line_height) % self.height
+        tft.show()
+        tft.scroll_to(self.offset)
+
+    # Opaque text, with the rest of the row cleared
+    def _draw_line(self, text, y):
+        tft = self.tft
+        width = tft.renderer.text_size(text, self.font)[0] * self.scale
+        if width > 0:
+            tft.draw_text(text, 0, y, self.fg, self.font, self.bg, self.scale)
+        if width < tft.width:
+            tft.draw_rect(width, y, tft.width - width, self.line_height, self.bg)
+
+    # Stop scrolling. The rows are left in memory order, so the lines may show out of order.
+    def close(self):
+        self.tft.stop_scroll()
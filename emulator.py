@@ -0,0 +1,742 @@
+# Host-side stand-ins for the MicroPython modules the driver depends on (machine.Pin, machine.SPI,
+# framebuf, micropython.const and the time.*_ms helpers), plus an emulated ST7735 panel.
+#
+# Usage on CPython:
+#     import emulator
+#     panel = emulator.install(dc=22, cs=21, rt=15, spi_port=0)
+#     from ST7735 import ST7735
+#     tft = ST7735(dc=22, cs=21, rt=15, sck=18, mosi=19, miso=16, spi_port=0)
+#
+# The panel is "wired" to the same pin numbers and SPI port that the driver is constructed with. It
+# decodes the command stream (CASET/RASET/RAMWR and friends) into an in-memory RGB565 image and
+# counts what went over the bus so the render paths can be measured without hardware.
+import sys
+import time
+import builtins
+from array import array
+
+def const(x):
+    return x
+
+# ---------------------------------------------------------------------------------------------
+# time helpers missing from CPython
+# ---------------------------------------------------------------------------------------------
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+def sleep_us(us):
+    time.sleep(us / 1_000_000)
+
+def ticks_ms():
+    return time.monotonic_ns() // 1_000_000
+
+def ticks_us():
+    return time.monotonic_ns() // 1_000
+
+def ticks_diff(end, start):
+    return end - start
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+# ---------------------------------------------------------------------------------------------
+# machine.Pin / machine.SPI
+# ---------------------------------------------------------------------------------------------
+# Pin levels by pin id, shared by every Pin object so panels can observe the wires
+_pin_levels = {}
+# Emulated panels by SPI port
+_panels = {}
+
+class Pin:
+    IN = const(0)
+    OUT = const(1)
+    OPEN_DRAIN = const(2)
+    ALT = const(3)
+    ALT_SPI = const(4)
+    PULL_UP = const(1)
+    PULL_DOWN = const(2)
+
+    def __init__(self, id, mode=-1, pull=-1, *, value=None, alt=-1):
+        self.id = id
+        self.mode = mode
+        if value is not None:
+            self._set(value)
+        else:
+            _pin_levels.setdefault(id, 0)
+
+    def _set(self, v):
+        v = 1 if v else 0
+        old = _pin_levels.get(self.id)
+        _pin_levels[self.id] = v
+        if old != v:
+            for panel in _panels.values():
+                panel.pin_changed(self.id, v)
+
+    def value(self, v=None):
+        if v is None:
+            return _pin_levels.get(self.id, 0)
+        self._set(v)
+
+    def low(self):
+        self._set(0)
+
+    def high(self):
+        self._set(1)
+
+    def on(self):
+        self._set(1)
+
+    def off(self):
+        self._set(0)
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+class SPI:
+    MSB = const(0)
+    LSB = const(1)
+
+    def __init__(self, id, baudrate=1_000_000, *, polarity=0, phase=0, bits=8, firstbit=MSB, sck=None, mosi=None, miso=None):
+        self.id = id
+        self.baudrate = baudrate
+
+    def init(self, baudrate=None, **kwargs):
+        if baudrate is not None:
+            self.baudrate = baudrate
+
+    def deinit(self):
+        pass
+
+    def write(self, buf):
+        panel = _panels.get(self.id)
+        if panel is not None:
+            panel.receive(buf)
+
+    def read(self, nbytes, write=0x00):
+        return bytes(nbytes)
+
+    def readinto(self, buf, write=0x00):
+        for i in range(len(buf)):
+            buf[i] = 0
+
+    def write_readinto(self, write_buf, read_buf):
+        self.write(write_buf)
+        self.readinto(read_buf)
+
+# ---------------------------------------------------------------------------------------------
+# framebuf
+# ---------------------------------------------------------------------------------------------
+MONO_VLSB = const(0)
+RGB565 = const(1)
+GS4_HMSB = const(2)
+MONO_HLSB = const(3)
+MONO_HMSB = const(4)
+GS2_HMSB = const(5)
+GS8 = const(6)
+
+# 8x8 font laid out like the firmware font used by framebuf.text: 8 column bytes per character,
+# least significant bit at the top, characters 32-127
+_font_8x8 = bytes((
+    0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00, # ' '
+    0x00,0x00,0x00,0x4f,0x4f,0x00,0x00,0x00, # !
+    0x00,0x07,0x07,0x00,0x00,0x07,0x07,0x00, # "
+    0x14,0x7f,0x7f,0x14,0x14,0x7f,0x7f,0x14, # #
+    0x00,0x24,0x2e,0x6b,0x6b,0x3a,0x12,0x00, # $
+    0x00,0x63,0x33,0x18,0x0c,0x66,0x63,0x00, # %
+    0x00,0x32,0x7f,0x4d,0x4d,0x77,0x72,0x50, # &
+    0x00,0x00,0x00,0x04,0x06,0x03,0x01,0x00, # '
+    0x00,0x00,0x1c,0x3e,0x63,0x41,0x00,0x00, # (
+    0x00,0x00,0x41,0x63,0x3e,0x1c,0x00,0x00, # )
+    0x08,0x2a,0x3e,0x1c,0x1c,0x3e,0x2a,0x08, # *
+    0x00,0x08,0x08,0x3e,0x3e,0x08,0x08,0x00, # +
+    0x00,0x00,0x80,0xe0,0x60,0x00,0x00,0x00, # ,
+    0x00,0x08,0x08,0x08,0x08,0x08,0x08,0x00, # -
+    0x00,0x00,0x00,0x60,0x60,0x00,0x00,0x00, # .
+    0x00,0x40,0x60,0x30,0x18,0x0c,0x06,0x02, # /
+    0x00,0x3e,0x7f,0x49,0x45,0x7f,0x3e,0x00, # 0
+    0x00,0x40,0x44,0x7f,0x7f,0x40,0x40,0x00, # 1
+    0x00,0x62,0x73,0x51,0x49,0x4f,0x46,0x00, # 2
+    0x00,0x22,0x63,0x49,0x49,0x7f,0x36,0x00, # 3
+    0x00,0x18,0x18,0x14,0x16,0x7f,0x7f,0x10, # 4
+    0x00,0x27,0x67,0x45,0x45,0x7d,0x39,0x00, # 5
+    0x00,0x3e,0x7f,0x49,0x49,0x7b,0x32,0x00, # 6
+    0x00,0x03,0x03,0x79,0x7d,0x07,0x03,0x00, # 7
+    0x00,0x36,0x7f,0x49,0x49,0x7f,0x36,0x00, # 8
+    0x00,0x26,0x6f,0x49,0x49,0x7f,0x3e,0x00, # 9
+    0x00,0x00,0x00,0x24,0x24,0x00,0x00,0x00, # :
+    0x00,0x00,0x80,0xe4,0x64,0x00,0x00,0x00, # ;
+    0x00,0x08,0x1c,0x36,0x63,0x41,0x41,0x00, # <
+    0x00,0x14,0x14,0x14,0x14,0x14,0x14,0x00, # =
+    0x00,0x41,0x41,0x63,0x36,0x1c,0x08,0x00, # >
+    0x00,0x02,0x03,0x51,0x59,0x0f,0x06,0x00, # ?
+    0x00,0x3e,0x7f,0x41,0x4d,0x4f,0x2e,0x00, # @
+    0x00,0x7c,0x7e,0x0b,0x0b,0x7e,0x7c,0x00, # A
+    0x00,0x7f,0x7f,0x49,0x49,0x7f,0x36,0x00, # B
+    0x00,0x3e,0x7f,0x41,0x41,0x63,0x22,0x00, # C
+    0x00,0x7f,0x7f,0x41,0x63,0x3e,0x1c,0x00, # D
+    0x00,0x7f,0x7f,0x49,0x49,0x41,0x41,0x00, # E
+    0x00,0x7f,0x7f,0x09,0x09,0x01,0x01,0x00, # F
+    0x00,0x3e,0x7f,0x41,0x49,0x7b,0x3a,0x00, # G
+    0x00,0x7f,0x7f,0x08,0x08,0x7f,0x7f,0x00, # H
+    0x00,0x00,0x41,0x7f,0x7f,0x41,0x00,0x00, # I
+    0x00,0x20,0x60,0x41,0x7f,0x3f,0x01,0x00, # J
+    0x00,0x7f,0x7f,0x1c,0x36,0x63,0x41,0x00, # K
+    0x00,0x7f,0x7f,0x40,0x40,0x40,0x40,0x00, # L
+    0x00,0x7f,0x7f,0x06,0x0c,0x06,0x7f,0x7f, # M
+    0x00,0x7f,0x7f,0x0e,0x1c,0x7f,0x7f,0x00, # N
+    0x00,0x3e,0x7f,0x41,0x41,0x7f,0x3e,0x00, # O
+    0x00,0x7f,0x7f,0x09,0x09,0x0f,0x06,0x00, # P
+    0x00,0x1e,0x3f,0x21,0x61,0x7f,0x5e,0x00, # Q
+    0x00,0x7f,0x7f,0x19,0x39,0x6f,0x46,0x00, # R
+    0x00,0x26,0x6f,0x49,0x49,0x7b,0x32,0x00, # S
+    0x00,0x01,0x01,0x7f,0x7f,0x01,0x01,0x00, # T
+    0x00,0x3f,0x7f,0x40,0x40,0x7f,0x3f,0x00, # U
+    0x00,0x1f,0x3f,0x60,0x60,0x3f,0x1f,0x00, # V
+    0x00,0x7f,0x7f,0x30,0x18,0x30,0x7f,0x7f, # W
+    0x00,0x63,0x77,0x1c,0x1c,0x77,0x63,0x00, # X
+    0x00,0x07,0x0f,0x78,0x78,0x0f,0x07,0x00, # Y
+    0x00,0x61,0x71,0x59,0x4d,0x47,0x43,0x00, # Z
+    0x00,0x00,0x7f,0x7f,0x41,0x41,0x00,0x00, # [
+    0x00,0x02,0x06,0x0c,0x18,0x30,0x60,0x40, # backslash
+    0x00,0x00,0x41,0x41,0x7f,0x7f,0x00,0x00, # ]
+    0x00,0x08,0x0c,0x06,0x06,0x0c,0x08,0x00, # ^
+    0xc0,0xc0,0xc0,0xc0,0xc0,0xc0,0xc0,0xc0, # _
+    0x00,0x00,0x01,0x03,0x06,0x04,0x00,0x00, # `
+    0x00,0x20,0x74,0x54,0x54,0x7c,0x78,0x00, # a
+    0x00,0x7f,0x7f,0x44,0x44,0x7c,0x38,0x00, # b
+    0x00,0x38,0x7c,0x44,0x44,0x6c,0x28,0x00, # c
+    0x00,0x38,0x7c,0x44,0x44,0x7f,0x7f,0x00, # d
+    0x00,0x38,0x7c,0x54,0x54,0x5c,0x58,0x00, # e
+    0x00,0x08,0x7e,0x7f,0x09,0x03,0x02,0x00, # f
+    0x00,0x98,0xbc,0xa4,0xa4,0xfc,0x7c,0x00, # g
+    0x00,0x7f,0x7f,0x04,0x04,0x7c,0x78,0x00, # h
+    0x00,0x00,0x00,0x7d,0x7d,0x00,0x00,0x00, # i
+    0x00,0x40,0xc0,0x80,0x80,0xfd,0x7d,0x00, # j
+    0x00,0x7f,0x7f,0x30,0x38,0x6c,0x44,0x00, # k
+    0x00,0x00,0x41,0x7f,0x7f,0x40,0x00,0x00, # l
+    0x00,0x7c,0x7c,0x18,0x30,0x18,0x7c,0x7c, # m
+    0x00,0x7c,0x7c,0x04,0x04,0x7c,0x78,0x00, # n
+    0x00,0x38,0x7c,0x44,0x44,0x7c,0x38,0x00, # o
+    0x00,0xfc,0xfc,0x24,0x24,0x3c,0x18,0x00, # p
+    0x00,0x18,0x3c,0x24,0x24,0xfc,0xfc,0x00, # q
+    0x00,0x7c,0x7c,0x04,0x04,0x0c,0x08,0x00, # r
+    0x00,0x48,0x5c,0x54,0x54,0x74,0x24,0x00, # s
+    0x00,0x04,0x04,0x3e,0x7e,0x44,0x44,0x00, # t
+    0x00,0x3c,0x7c,0x40,0x40,0x7c,0x7c,0x00, # u
+    0x00,0x1c,0x3c,0x60,0x60,0x3c,0x1c,0x00, # v
+    0x00,0x1c,0x7c,0x70,0x38,0x70,0x7c,0x1c, # w
+    0x00,0x44,0x6c,0x38,0x38,0x6c,0x44,0x00, # x
+    0x00,0x9c,0xbc,0xa0,0xe0,0x7c,0x3c,0x00, # y
+    0x00,0x44,0x64,0x74,0x5c,0x4c,0x44,0x00, # z
+    0x00,0x08,0x08,0x3e,0x77,0x41,0x41,0x00, # {
+    0x00,0x00,0x00,0xff,0xff,0x00,0x00,0x00, # |
+    0x00,0x41,0x41,0x77,0x3e,0x08,0x08,0x00, # }
+    0x00,0x02,0x03,0x01,0x03,0x02,0x03,0x01, # ~
+    0xaa,0x55,0xaa,0x55,0xaa,0x55,0xaa,0x55, # 127, also used for anything unprintable
+))
+
+# Integer division truncating towards zero, as the C implementation does
+def _cdiv(a, b):
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+# Pure Python framebuf.FrameBuffer supporting the MONO_HLSB and RGB565 formats
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        if format not in (MONO_HLSB, RGB565):
+            raise ValueError("unsupported format")
+        self._buf = buffer
+        self._width = width
+        self._height = height
+        self._format = format
+        if stride is None:
+            stride = width
+        self._stride = (stride + 7) >> 3 if format == MONO_HLSB else stride * 2
+
+    def _setpixel(self, x, y, c):
+        buf = self._buf
+        if self._format == MONO_HLSB:
+            i = y * self._stride + (x >> 3)
+            mask = 0x80 >> (x & 7)
+            if c:
+                buf[i] |= mask
+            else:
+                buf[i] &= ~mask & 0xFF
+        else:
+            i = y * self._stride + x * 2
+            buf[i] = c & 0xFF
+            buf[i + 1] = (c >> 8) & 0xFF
+
+    def _getpixel(self, x, y):
+        buf = self._buf
+        if self._format == MONO_HLSB:
+            return (buf[y * self._stride + (x >> 3)] >> (7 - (x & 7))) & 1
+        i = y * self._stride + x * 2
+        return buf[i] | (buf[i + 1] << 8)
+
+    def _setpixel_checked(self, x, y, c, mask=True):
+        if mask and 0 <= x < self._width and 0 <= y < self._height:
+            self._setpixel(x, y, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        if h < 1 or w < 1 or x + w <= 0 or y + h <= 0 or y >= self._height or x >= self._width:
+            return
+        xend = min(self._width, x + w)
+        yend = min(self._height, y + h)
+        x = max(x, 0)
+        y = max(y, 0)
+        if self._format == RGB565:
+            px = bytes((c & 0xFF, (c >> 8) & 0xFF)) * (xend - x)
+            stride = self._stride
+            for row in range(y, yend):
+                start = row * stride + x * 2
+                self._buf[start:start + len(px)] = px
+            return
+        setpixel = self._setpixel
+        for row in range(y, yend):
+            for col in range(x, xend):
+                setpixel(col, row, c)
+
+    def fill(self, c):
+        self.fill_rect(0, 0, self._width, self._height, c)
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            return None
+        if c is None:
+            return self._getpixel(x, y)
+        self._setpixel(x, y, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+        else:
+            self.fill_rect(x, y, w, 1, c)
+            self.fill_rect(x, y + h - 1, w, 1, c)
+            self.fill_rect(x, y, 1, h, c)
+            self.fill_rect(x + w - 1, y, 1, h, c)
+
+    def line(self, x1, y1, x2, y2, c):
+        dx = x2 - x1
+        if dx > 0:
+            sx = 1
+        else:
+            dx = -dx
+            sx = -1
+        dy = y2 - y1
+        if dy > 0:
+            sy = 1
+        else:
+            dy = -dy
+            sy = -1
+        steep = dy > dx
+        if steep:
+            x1, y1 = y1, x1
+            dx, dy = dy, dx
+            sx, sy = sy, sx
+        e = 2 * dy - dx
+        for _ in range(dx):
+            if steep:
+                self._setpixel_checked(y1, x1, c)
+            else:
+                self._setpixel_checked(x1, y1, c)
+            while e >= 0:
+                y1 += sy
+                e -= 2 * dx
+            x1 += sx
+            e += 2 * dy
+        self._setpixel_checked(x2, y2, c)
+
+    def _ellipse_points(self, cx, cy, x, y, c, mask):
+        if mask & 0x10:
+            if mask & 1:
+                self.fill_rect(cx, cy - y, x + 1, 1, c)
+            if mask & 2:
+                self.fill_rect(cx - x, cy - y, x + 1, 1, c)
+            if mask & 4:
+                self.fill_rect(cx - x, cy + y, x + 1, 1, c)
+            if mask & 8:
+                self.fill_rect(cx, cy + y, x + 1, 1, c)
+        else:
+            self._setpixel_checked(cx + x, cy - y, c, mask & 1)
+            self._setpixel_checked(cx - x, cy - y, c, mask & 2)
+            self._setpixel_checked(cx - x, cy + y, c, mask & 4)
+            self._setpixel_checked(cx + x, cy + y, c, mask & 8)
+
+    def ellipse(self, cx, cy, xr, yr, c, f=False, m=0x0F):
+        mask = (0x10 if f else 0) | (m & 0x0F)
+        two_asquare = 2 * xr * xr
+        two_bsquare = 2 * yr * yr
+        x = xr
+        y = 0
+        xchange = yr * yr * (1 - 2 * xr)
+        ychange = xr * xr
+        error = 0
+        stoppingx = two_bsquare * xr
+        stoppingy = 0
+        while stoppingx >= stoppingy:
+            self._ellipse_points(cx, cy, x, y, c, mask)
+            y += 1
+            stoppingy += two_asquare
+            error += ychange
+            ychange += two_asquare
+            if 2 * error + xchange > 0:
+                x -= 1
+                stoppingx -= two_bsquare
+                error += xchange
+                xchange += two_bsquare
+        x = 0
+        y = yr
+        xchange = yr * yr
+        ychange = xr * xr * (1 - 2 * yr)
+        error = 0
+        stoppingx = 0
+        stoppingy = two_asquare * yr
+        while stoppingx <= stoppingy:
+            self._ellipse_points(cx, cy, x, y, c, mask)
+            x += 1
+            stoppingx += two_bsquare
+            error += xchange
+            xchange += two_bsquare
+            if 2 * error + ychange > 0:
+                y -= 1
+                stoppingy -= two_asquare
+                error += ychange
+                ychange += two_asquare
+
+    def poly(self, x, y, coords, c, f=False):
+        n = len(coords) // 2
+        if n == 0:
+            return
+        if not f:
+            px1, py1 = coords[0], coords[1]
+            for i in range(n - 1, -1, -1):
+                px2, py2 = coords[i * 2], coords[i * 2 + 1]
+                self.line(x + px1, y + py1, x + px2, y + py2, c)
+                px1, py1 = px2, py2
+            return
+
+        ys = [coords[i * 2 + 1] for i in range(n)]
+        for row in range(min(ys), max(ys) + 1):
+            nodes = []
+            px1, py1 = coords[0], coords[1]
+            for i in range(n - 1, -1, -1):
+                px2, py2 = coords[i * 2], coords[i * 2 + 1]
+                if py1 != py2 and ((py1 > row >= py2) or (py1 <= row < py2)):
+                    nodes.append(_cdiv(32 * px1 + _cdiv(32 * (px2 - px1) * (row - py1), py2 - py1) + 16, 32))
+                elif row == max(py1, py2):
+                    if py1 < py2:
+                        self._setpixel_checked(x + px2, y + py2, c)
+                    elif py2 < py1:
+                        self._setpixel_checked(x + px1, y + py1, c)
+                    else:
+                        self.fill_rect(x + min(px1, px2), y + py1, abs(px1 - px2) + 1, 1, c)
+                px1, py1 = px2, py2
+            nodes.sort()
+            for i in range(0, len(nodes) - 1, 2):
+                self.fill_rect(x + nodes[i], y + row, nodes[i + 1] - nodes[i] + 1, 1, c)
+
+    def text(self, s, x, y, c=1):
+        for ch in str(s).encode():
+            if ch < 32 or ch > 127:
+                ch = 127
+            offset = (ch - 32) * 8
+            for j in range(8):
+                if 0 <= x < self._width:
+                    vline = _font_8x8[offset + j]
+                    row = y
+                    while vline:
+                        if vline & 1 and 0 <= row < self._height:
+                            self._setpixel(x, row, c)
+                        vline >>= 1
+                        row += 1
+                x += 1
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        for sy in range(fbuf._height):
+            for sx in range(fbuf._width):
+                c = fbuf._getpixel(sx, sy)
+                if palette is not None:
+                    c = palette._getpixel(c, 0)
+                if c != key:
+                    self._setpixel_checked(x + sx, y + sy, c)
+
+    def scroll(self, xstep, ystep):
+        w, h = self._width, self._height
+        xs = range(w) if xstep < 0 else range(w - 1, -1, -1)
+        ys = range(h) if ystep < 0 else range(h - 1, -1, -1)
+        for y in ys:
+            for x in xs:
+                sx, sy = x - xstep, y - ystep
+                if 0 <= sx < w and 0 <= sy < h:
+                    self._setpixel(x, y, self._getpixel(sx, sy))
+
+# ---------------------------------------------------------------------------------------------
+# Emulated panel
+# ---------------------------------------------------------------------------------------------
+_CASET = const(0x2A)
+_RASET = const(0x2B)
+_RAMWR = const(0x2C)
+_MADCTL = const(0x36)
+_SWRESET = const(0x01)
+_SLPIN = const(0x10)
+_SLPOUT = const(0x11)
+_PTLON = const(0x12)
+_NORON = const(0x13)
+_PTLAR = const(0x30)
+_VSCRDEF = const(0x33)
+_VSCRSADD = const(0x37)
+_IDMOFF = const(0x38)
+_IDMON = const(0x39)
+# Time the panel needs between sleep commands, in ms
+_SLEEP_DELAY_MS = const(120)
+
+# Costs used by Panel.modelled_time, in microseconds. These approximate a MicroPython build on an
+# RP2040: the cost of calling spi.write() and the cost of toggling a Pin from Python.
+WRITE_OVERHEAD_US = const(4)
+PIN_TOGGLE_US = const(1)
+
+class Panel:
+    # Address space large enough for any CASET/RASET the driver sends in either orientation
+    ADDR_SIZE = const(162)
+
+    def __init__(self, dc, cs, rt=None, spi_port=0, width=80, height=160, col_offset=24, row_offset=0):
+        self.dc = dc
+        self.cs = cs
+        self.rt = rt
+        self.spi_port = spi_port
+        self.panel_width = width
+        self.panel_height = height
+        self.col_offset = col_offset
+        self.row_offset = row_offset
+        self.gram = array("H", bytes(2 * self.ADDR_SIZE * self.ADDR_SIZE))
+        self._reset_state()
+        self.reset_counters()
+
+    def _reset_state(self):
+        self.madctl = 0
+        self.command = None
+        self.args = bytearray()
+        self.window = (0, self.ADDR_SIZE - 1, 0, self.ADDR_SIZE - 1)
+        self._cursor_x = 0
+        self._cursor_y = 0
+        self._pixel_hi = None
+        # Vertical scrolling: fixed top, scroll area and fixed bottom rows, and the start address.
+        # scrolling is set by VSCRSADD and cleared by NORON.
+        self.scroll_areas = (0, self.ADDR_SIZE, 0)
+        self.scroll_start = 0
+        self.scrolling = False
+        # Partial mode shows only the rows of partial_rows (first, last), blank elsewhere
+        self.partial_rows = (0, self.ADDR_SIZE - 1)
+        self.partial = False
+        self.idle = False
+        self.sleeping = False
+        self._sleep_ticks = None
+        # Sleep commands sent sooner than the panel accepts them
+        self.sleep_violations = 0
+
+    def reset_counters(self):
+        self.command_bytes = 0
+        self.data_bytes = 0
+        self.pixel_bytes = 0
+        self.writes = 0
+        self.transactions = 0
+        self.cs_toggles = 0
+        self.dc_toggles = 0
+        self.commands = {}
+
+    # Snapshot of the counters as a dict, for reporting
+    def stats(self):
+        return {
+            "command_bytes": self.command_bytes,
+            "data_bytes": self.data_bytes,
+            "pixel_bytes": self.pixel_bytes,
+            "writes": self.writes,
+            "transactions": self.transactions,
+            "cs_toggles": self.cs_toggles,
+            "dc_toggles": self.dc_toggles,
+            "commands": dict(self.commands),
+        }
+
+    # Time the recorded traffic would take at the given baud, including per-call and per-toggle
+    # overhead, in seconds
+    def modelled_time(self, baud):
+        total_bytes = self.command_bytes + self.data_bytes
+        return (total_bytes * 8 / baud
+                + self.writes * WRITE_OVERHEAD_US / 1_000_000
+                + (self.cs_toggles + self.dc_toggles) * PIN_TOGGLE_US / 1_000_000)
+
+    def pin_changed(self, pin, level):
+        if pin == self.cs:
+            self.cs_toggles += 1
+            if level == 0:
+                self.transactions += 1
+        elif pin == self.dc:
+            self.dc_toggles += 1
+        elif pin == self.rt and level == 0:
+            self._reset_state()
+
+    def receive(self, buf):
+        if _pin_levels.get(self.cs, 1):
+            # Chip not selected, the panel ignores the bus
+            return
+        self.writes += 1
+        if _pin_levels.get(self.dc, 1) == 0:
+            self.command_bytes += len(buf)
+            for b in buf:
+                self._start_command(b)
+        else:
+            self.data_bytes += len(buf)
+            if self.command == _RAMWR:
+                self.pixel_bytes += len(buf)
+                self._write_pixels(buf)
+            else:
+                self.args.extend(buf)
+                self._apply_args()
+
+    def _start_command(self, cmd):
+        self.command = cmd
+        self.args = bytearray()
+        self.commands[cmd] = self.commands.get(cmd, 0) + 1
+        if cmd == _RAMWR:
+            self._cursor_x = self.window[0]
+            self._cursor_y = self.window[2]
+            self._pixel_hi = None
+        elif cmd == _SWRESET:
+            self._reset_state()
+        elif cmd == _NORON:
+            self.scrolling = False
+            self.partial = False
+        elif cmd == _PTLON:
+            self.scrolling = False
+            self.partial = True
+        elif cmd == _IDMON or cmd == _IDMOFF:
+            self.idle = cmd == _IDMON
+        elif cmd == _SLPIN or cmd == _SLPOUT:
+            now = ticks_ms()
+            if self._sleep_ticks is not None and now - self._sleep_ticks < _SLEEP_DELAY_MS:
+                self.sleep_violations += 1
+            self._sleep_ticks = now
+            self.sleeping = cmd == _SLPIN
+
+    def _apply_args(self):
+        cmd = self.command
+        args = self.args
+        if cmd in (_CASET, _RASET) and len(args) >= 4:
+            start = (args[0] << 8) | args[1]
+            end = (args[2] << 8) | args[3]
+            xs, xe, ys, ye = self.window
+            self.window = (start, end, ys, ye) if cmd == _CASET else (xs, xe, start, end)
+        elif cmd == _MADCTL and len(args) >= 1:
+            self.madctl = args[0]
+        elif cmd == _VSCRDEF and len(args) >= 6:
+            self.scroll_areas = ((args[0] << 8) | args[1], (args[2] << 8) | args[3], (args[4] << 8) | args[5])
+        elif cmd == _PTLAR and len(args) >= 4:
+            self.partial_rows = ((args[0] << 8) | args[1], (args[2] << 8) | args[3])
+        elif cmd == _VSCRSADD and len(args) >= 2:
+            self.scroll_start = (args[0] << 8) | args[1]
+            self.scrolling = True
+
+    def _write_pixels(self, buf):
+        gram = self.gram
+        size = self.ADDR_SIZE
+        xs, xe, ys, ye = self.window
+        x = self._cursor_x
+        y = self._cursor_y
+        hi = self._pixel_hi
+        for b in buf:
+            if hi is None:
+                hi = b
+                continue
+            if x < size and y < size:
+                gram[y * size + x] = (hi << 8) | b
+            hi = None
+            x += 1
+            if x > xe:
+                x = xs
+                y += 1
+                if y > ye:
+                    y = ys
+        self._cursor_x = x
+        self._cursor_y = y
+        self._pixel_hi = hi
+
+    # Offsets into the address space of the visible area, which swap when the row/column exchange
+    # bit of MADCTL is set
+    def _offsets(self):
+        if self.madctl & 0x20:
+            return self.row_offset, self.col_offset
+        return self.col_offset, self.row_offset
+
+    @property
+    def width(self):
+        return self.panel_height if self.madctl & 0x20 else self.panel_width
+
+    @property
+    def height(self):
+        return self.panel_width if self.madctl & 0x20 else self.panel_height
+
+    # RGB565 value of the pixel shown at x, y in the driver's current coordinate space. Nothing is
+    # shown while asleep, or outside the partial rows in partial mode.
+    def pixel(self, x, y):
+        if self.sleeping:
+            return 0
+        c_off, r_off = self._offsets()
+        row = y + r_off
+        if not self.madctl & 0x20:
+            if self.partial and not self.partial_rows[0] <= row <= self.partial_rows[1]:
+                return 0
+            if self.scrolling:
+                # Rows in the scroll area show memory from the start address on, wrapping within it
+                top, area, _ = self.scroll_areas
+                if top <= row < top + area:
+                    row = top + (self.scroll_start - top + row - top) % area
+        c = self.gram[row * self.ADDR_SIZE + x + c_off]
+        if self.idle:
+            # 8 colours, each component fully on or off from its top bit
+            c = (0xF800 if c & 0x8000 else 0) | (0x07E0 if c & 0x0400 else 0) | (0x001F if c & 0x0010 else 0)
+        return c
+
+    # The visible area as a flat array of RGB565 values, row by row
+    def image(self):
+        pixel = self.pixel
+        return array("H", [pixel(x, y) for y in range(self.height) for x in range(self.width)])
+
+    def clear(self, c=0):
+        for i in range(len(self.gram)):
+            self.gram[i] = c
+
+# ---------------------------------------------------------------------------------------------
+# Installation
+# ---------------------------------------------------------------------------------------------
+def _module(name, **attrs):
+    mod = type(sys)(name)
+    mod.__dict__.update(attrs)
+    return mod
+
+# Register the stand-in modules so `from machine import Pin, SPI` and `import framebuf` resolve to
+# this file, and attach an emulated panel to the given pins and SPI port. Returns the panel.
+def install(dc=22, cs=21, rt=15, spi_port=0, **panel_kwargs):
+    sys.modules.setdefault("machine", _module("machine", Pin=Pin, SPI=SPI))
+    sys.modules.setdefault("micropython", _module("micropython", const=const))
+    sys.modules.setdefault("framebuf", _module(
+        "framebuf",
+        FrameBuffer=FrameBuffer,
+        MONO_VLSB=MONO_VLSB, RGB565=RGB565, GS4_HMSB=GS4_HMSB, MONO_HLSB=MONO_HLSB,
+        MONO_HMSB=MONO_HMSB, GS2_HMSB=GS2_HMSB, GS8=GS8
+    ))
+    # const() is a compiler builtin on MicroPython, the modules here use it without importing it
+    builtins.const = const
+    for name in ("sleep_ms", "sleep_us", "ticks_ms", "ticks_us", "ticks_diff", "ticks_add"):
+        if not hasattr(time, name):
+            setattr(time, name, globals()[name])
+
+    panel = Panel(dc, cs, rt, spi_port, **panel_kwargs)
+    _panels[spi_port] = panel
+    return panel
@@ -0,0 +1,165 @@
+import framebuf
+from collections import OrderedDict
+
+# Bitmap font file format, all integers little endian:
+#   magic       4 bytes, b'STBF'
+#   height      1 byte, glyph height in pixels
+#   default     3 bytes, code point drawn for characters missing from the font
+#   count       2 bytes, number of glyphs
+#   index       count entries of 8 bytes sorted by code point:
+#                   code point (4 bytes), bitmap offset (3 bytes), width (1 byte)
+#   bitmaps     for each glyph, height rows of (width + 7) // 8 bytes, leftmost pixel in the
+#               most significant bit (framebuf.MONO_HLSB). The width is also the advance.
+BITMAP_FONT_MAGIC = const(b'STBF')
+INDEX_ENTRY_SIZE = const(8)
+
+# Bookkeeping per cache entry on top of the size of its value, roughly what an entry costs in RAM
+LRU_ENTRY_COST = const(32)
+
+# Least recently used cache with a byte budget. Values must support len().
+class LRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        value = self._entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        # Move it to the most recently used end
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old) + LRU_ENTRY_COST
+        cost = len(value) + LRU_ENTRY_COST
+        if cost > self.max_bytes:
+            return
+        while self.size + cost > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self.size -= len(self._entries.pop(oldest)) + LRU_ENTRY_COST
+        self._entries[key] = value
+        self.size += cost
+
+    def clear(self):
+        self._entries = OrderedDict()
+        self.size = 0
+
+# Bitmap font read from a file in the format above. Only the index is kept in RAM; glyph bitmaps
+# are read from the file when a glyph is first drawn, and their rect decompositions are kept in an
+# LRU cache of cache_size bytes.
+class BitmapFont:
+    def __init__(self, path, cache_size=2048):
+        self.file = open(path, "rb")
+        header = self.file.read(10)
+        if len(header) < 10 or header[0:4] != BITMAP_FONT_MAGIC:
+            raise ValueError("Not a bitmap font file")
+        self.height = header[4]
+        self.default = int.from_bytes(header[5:8], 'little')
+        self.count = int.from_bytes(header[8:10], 'little')
+        self.index = bytearray(self.count * INDEX_ENTRY_SIZE)
+        if self.file.readinto(self.index) != len(self.index):
+            raise ValueError("Truncated bitmap font file")
+        self.data_start = 10 + len(self.index)
+        self.glyph_cache = LRUCache(cache_size)
+
+    def close(self):
+        self.file.close()
+
+    # Position of the code point in the index, or -1 if the font doesn't have it
+    def find(self, code):
+        index = self.index
+        lo = 0
+        hi = self.count - 1
+        while lo <= hi:
+            mid = (lo + hi) >> 1
+            pos = mid * INDEX_ENTRY_SIZE
+            mid_code = index[pos] | (index[pos + 1] << 8) | (index[pos + 2] << 16) | (index[pos + 3] << 24)
+            if mid_code == code:
+                return mid
+            if mid_code < code:
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return -1
+
+    def _entry(self, code):
+        i = self.find(code)
+        if i < 0:
+            i = self.find(self.default)
+            if i < 0:
+                return None
+        pos = i * INDEX_ENTRY_SIZE
+        index = self.index
+        offset = index[pos + 4] | (index[pos + 5] << 8) | (index[pos + 6] << 16)
+        return offset, index[pos + 7]
+
+    # Width (advance) of a character, 0 if neither it nor the default glyph is in the font
+    def char_width(self, code):
+        entry = self._entry(code)
+        return 0 if entry is None else entry[1]
+
+    def text_width(self, text):
+        return sum(self.char_width(ord(ch)) for ch in text)
+
+    # (width, bitmap) for a character, or None. Read from the file each call.
+    def glyph_bitmap(self, code):
+        entry = self._entry(code)
+        if entry is None:
+            return None
+        offset, width = entry
+        self.file.seek(self.data_start + offset)
+        return width, self.file.read(((width + 7) >> 3) * self.height)
+
+    # (width, rects) for a character, rects relative to the glyph's top left in [x, y, w, h, ...]
+    # format. Decomposed with the renderer's framebuffer and cached.
+    def glyph_rects(self, code, renderer):
+        glyph = self.glyph_cache.get(code)
+        if glyph is not None:
+            return glyph[0], glyph[1:]
+        bitmap = self.glyph_bitmap(code)
+        if bitmap is None:
+            return 0, b''
+        width, data = bitmap
+        rects = b''
+        if width > 0:
+            mono_fb = renderer.mono_fb
+            glyph_fb = framebuf.FrameBuffer(bytearray(data), width, self.height, framebuf.MONO_HLSB)
+            mono_fb.fill_rect(0, 0, width, self.height, 0)
+            mono_fb.blit(glyph_fb, 0, 0)
+            rects = renderer.find_rects_in_fb(0, width - 1, 0, self.height - 1)
+        # Stored with the width in front so one bytes object holds the whole entry
+        glyph = bytes((width,)) + bytes(rects)
+        self.glyph_cache.put(code, glyph)
+        return width, glyph[1:]
+
+# Write a bitmap font file. glyphs maps code points to (width, bitmap) in the layout described above.
+def write_font(path, height, glyphs, default=ord("?")):
+    codes = sorted(glyphs)
+    with open(path, "wb") as f:
+        f.write(BITMAP_FONT_MAGIC)
+        f.write(bytes((height,)))
+        f.write(default.to_bytes(3, 'little'))
+        f.write(len(codes).to_bytes(2, 'little'))
+        offset = 0
+        for code in codes:
+            width, bitmap = glyphs[code]
+            f.write(code.to_bytes(4, 'little'))
+            f.write(offset.to_bytes(3, 'little'))
+            f.write(bytes((width,)))
+            offset += len(bitmap)
+        for code in codes:
+            f.write(glyphs[code][1])
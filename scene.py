@@ -0,0 +1,190 @@
+from ST7735 import add_region, clip_rects, translate_rects
+
+# Retained scene of shapes. Nodes are kept in z-order (later nodes on top), and changing a node
+# marks the area it covered and now covers as damaged. render() repaints only the damaged regions:
+# the background, then each node that overlaps, clipped to the region. The cost of a frame then
+# depends on what changed rather than on everything in the scene.
+class Scene:
+    def __init__(self, tft, background: bytes, max_damage=8):
+        self.tft = tft
+        self.background = background
+        self.max_damage = max_damage
+        self.nodes = []
+        # Damaged regions as [x0, y0, x1, y1], bottom right exclusive
+        self.damage = []
+        # Nodes added or changed since the last render, whose new area is damaged
+        self.changed = []
+        self.invalidate()
+
+    # Add a node on top of the others and return it
+    def add(self, node):
+        node.scene = self
+        self.nodes.append(node)
+        self.changed.append(node)
+        return node
+
+    def remove(self, node):
+        self.damage_node(node)
+        self.nodes.remove(node)
+        node.scene = None
+
+    # Damage the whole screen, e.g. after a rotation or drawing over the scene
+    def invalidate(self):
+        self.damage = []
+        self.add_damage(0, 0, self.tft.width, self.tft.height)
+
+    def add_damage(self, x0, y0, x1, y1):
+        add_region(self.damage, max(x0, 0), max(y0, 0), min(x1, self.tft.width), min(y1, self.tft.height), self.max_damage)
+
+    # Damage the area a node was last drawn over
+    def damage_node(self, node):
+        if node.bounds is not None:
+            self.add_damage(*node.bounds)
+
+    def render(self):
+        tft = self.tft
+        renderer = tft.renderer
+        for node in self.changed:
+            if node.scene is self:
+                node.update(renderer)
+                self.damage_node(node)
+        self.changed = []
+
+        for x0, y0, x1, y1 in self.damage:
+            tft.draw_rects(bytes((x0, y0, x1 - x0, y1 - y0)), self.background)
+            for node in self.nodes:
+                bounds = node.bounds
+                if bounds is None or bounds[0] >= x1 or bounds[2] <= x0 or bounds[1] >= y1 or bounds[3] <= y0:
+                    continue
+                for c, rects in node.layers:
+                    clipped = clip_rects(rects, x0, y0, x1, y1)
+                    if len(clipped) > 0:
+                        tft.draw_rects(clipped, c)
+        self.damage = []
+        tft.show()
+
+# A shape in a Scene. Change its properties with set() so the scene knows to redraw it.
+class Node:
+    def __init__(self, visible=True):
+        self.scene = None
+        self.visible = visible
+        # (colour, rects) to draw, bottom first, and the area they cover as (x0, y0, x1, y1) with
+        # the bottom right exclusive. Set by update().
+        self.layers = []
+        self.bounds = None
+
+    def set(self, **props):
+        scene = self.scene
+        if scene is not None:
+            scene.damage_node(self)
+            scene.changed.append(self)
+        for name, value in props.items():
+            setattr(self, name, value)
+
+    # Rebuild the layers and bounds from the properties
+    def update(self, renderer):
+        self.layers = self.build_layers(renderer) if self.visible else []
+        x0 = y0 = 0xFFFF
+        x1 = y1 = 0
+        for _, rects in self.layers:
+            for i in range(0, len(rects), 4):
+                if rects[i + 2] > 0 and rects[i + 3] > 0:
+                    x0 = min(x0, rects[i])
+                    y0 = min(y0, rects[i + 1])
+                    x1 = max(x1, rects[i] + rects[i + 2])
+                    y1 = max(y1, rects[i + 1] + rects[i + 3])
+        self.bounds = (x0, y0, x1, y1) if x1 > x0 else None
+
+    # List of (colour, rects), drawn in order
+    def build_layers(self, renderer):
+        raise NotImplementedError()
+
+class RectNode(Node):
+    def __init__(self, x, y, w, h, c: bytes, fill=True, thickness=1, visible=True):
+        super().__init__(visible)
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.c = c
+        self.fill = fill
+        self.thickness = thickness
+
+    def build_layers(self, renderer):
+        return [(self.c, bytes(renderer.draw_rect(self.x, self.y, self.w, self.h, self.fill, self.thickness)))]
+
+# Text, opaque if it has a background colour bg
+class TextNode(Node):
+    def __init__(self, text, x, y, c: bytes, font=None, bg: bytes | None = None, scale=1, visible=True):
+        super().__init__(visible)
+        self.text = text
+        self.x = x
+        self.y = y
+        self.c = c
+        self.font = font
+        self.bg = bg
+        self.scale = scale
+
+    def build_layers(self, renderer):
+        layers = []
+        if self.bg is not None:
+            w, h = renderer.text_size(self.text, self.font)
+            # Clipped to the screen, and left out if the text is off it
+            x = max(self.x, 0)
+            y = max(self.y, 0)
+            w = min(self.x + w * self.scale, renderer.width) - x
+            h = min(self.y + h * self.scale, renderer.height) - y
+            if w > 0 and h > 0:
+                layers.append((self.bg, bytes((x, y, w, h))))
+        if self.x < 0 or self.y < 0:
+            # The renderer can't place rects off the top or left, so compose at 0, 0 and move it
+            rects = translate_rects(renderer.draw_text(self.text, 0, 0, self.font, self.scale), self.x, self.y, renderer.width, renderer.height)
+        else:
+            rects = bytes(renderer.draw_text(self.text, self.x, self.y, self.font, self.scale))
+        layers.append((self.c, rects))
+        return layers
+
+class EllipseNode(Node):
+    def __init__(self, x, y, rx, ry, c: bytes, fill=True, visible=True):
+        super().__init__(visible)
+        self.x = x
+        self.y = y
+        self.rx = rx
+        self.ry = ry
+        self.c = c
+        self.fill = fill
+
+    def build_layers(self, renderer):
+        return [(self.c, bytes(renderer.draw_ellipse(self.x, self.y, self.rx, self.ry, self.fill)))]
+
+class PolyNode(Node):
+    def __init__(self, x, y, coords, c: bytes, fill=True, convex=False, visible=True):
+        super().__init__(visible)
+        self.x = x
+        self.y = y
+        self.coords = coords
+        self.c = c
+        self.fill = fill
+        self.convex = convex
+
+    def build_layers(self, renderer):
+        return [(self.c, bytes(renderer.draw_poly(self.x, self.y, self.coords, self.fill, self.convex)))]
+
+# A parsed svg.SVG drawn at x, y. It is rasterized once and then kept as rects, so moving it only
+# translates them.
+class SVGNode(Node):
+    def __init__(self, svg, x=0, y=0, visible=True):
+        super().__init__(visible)
+        self.svg = svg
+        self.x = x
+        self.y = y
+        self._svg_layers = None
+        self._svg_source = None
+
+    def build_layers(self, renderer):
+        if self._svg_source is not self.svg:
+            self._svg_layers = [(c.to_bytes(2, 'big'), bytes(rects)) for c, rects in renderer.draw_svg(self.svg)]
+            self._svg_source = self.svg
+        if self.x == 0 and self.y == 0:
+            return self._svg_layers
+        return [(c, translate_rects(rects, self.x, self.y, renderer.width, renderer.height)) for c, rects in self._svg_layers]
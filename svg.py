@@ -1,4 +1,7 @@
 from array import array
+import math
+import struct
+import sys
 
 try:
     import colours
@@ -6,12 +9,16 @@ except ImportError:
     colours = None 
 
 class Element:
-    def __init__(self, name, attributes):
+    # empty is True for a self-closing tag such as <g/>, which has no end tag
+    def __init__(self, name, attributes, empty=False):
         self.name = name
         self.attributes = attributes
+        self.empty = empty
 
 class SVG:
-    ValidElements = ("rect", "circle", "ellipse", "line", "polyline", "polygon")
+    ValidElements = ("rect", "circle", "ellipse", "line", "polyline", "polygon", "path")
+    # How far in pixels a flattened curve may stray from the true curve
+    PathTolerance = 0.5
     # Define a dictionary to map SVG units to their pixel values
     UnitsToPixels = {
         "px": 1,
@@ -87,154 +94,602 @@ class SVG:
     
     @staticmethod
     def length_to_pixels(length_string: str):
+        return int(SVG.parse_length(length_string))
+
+    # A length in pixels as a float, so it can be scaled before it is rounded
+    @staticmethod
+    def parse_length(length_string: str):
         # Split the length string into the numeric value and the unit
         length_string = length_string.strip().lower()
-        value = ''.join([c if c.isdigit() or c is '.' else '' for c in length_string])
-        unit = length_string.replace(value, '')
+        i = len(length_string)
+        while i > 0 and (length_string[i - 1].isalpha() or length_string[i - 1] == '%'):
+            i -= 1
+        value = length_string[:i]
+        unit = length_string[i:]
 
         try:
             value = float(value)
         except ValueError:
             raise ValueError(f"Invalid numeric value in SVG length: '{value}'")
         
-        if unit is '':
-            return int(value)
+        if unit == '':
+            return value
         elif unit not in SVG.UnitsToPixels.keys():
             raise ValueError(f"Unsupported SVG unit: '{unit}'")
 
-        return int(value * SVG.UnitsToPixels[unit])
+        return value * SVG.UnitsToPixels[unit]
+
+    # width and height, if given, are the size in pixels to fit the SVG's viewBox to instead of the
+    # size in its width and height attributes
+    @staticmethod
+    def read_svg(stream, width=None, height=None):
+        return SVG(list(SVG.iter_shapes(stream, width, height)))
 
+    # Yield the shapes of an SVG text stream one at a time as they are parsed, with their
+    # attributes converted. The viewBox, preserveAspectRatio and the transforms of the element and
+    # the groups it is in are applied here, so the shapes come out in whole pixels and drawing them
+    # costs the same as drawing an untransformed SVG.
     @staticmethod
-    def read_svg(stream):
-        reader = SimpleXMLReader()
-        elements = reader.get_all_elements(stream)
-        shapes = []
-        for e in elements:
-            if e.name not in SVG.ValidElements:
+    def iter_shapes(stream, width=None, height=None):
+        reader = SimpleXMLReader(end_tags=True)
+        # The transform of each open svg and g element, innermost last
+        transforms = []
+        for e in reader.iter_elements(stream):
+            name = e.name
+            if name == "svg" or name == "g":
+                if e.empty:
+                    continue
+                if name == "svg":
+                    if transforms:
+                        transform = SVG.viewport_transform(e.attributes)
+                    else:
+                        transform = SVG.viewport_transform(e.attributes, width, height)
+                else:
+                    transform = SVG.parse_transform(e.attributes.get('transform', ""))
+                if transforms:
+                    transform = multiply_transforms(transforms[-1], transform)
+                transforms.append(transform)
+                continue
+            if name == "/svg" or name == "/g":
+                if transforms:
+                    transforms.pop()
+                continue
+            if name not in SVG.ValidElements:
                 continue
 
             for attr,val in e.attributes.items():
                 if attr in ("fill", "stroke"):
                     e.attributes[attr] = SVG.colour_to_rgb(val)
                 elif 'x' in attr or 'y' in attr or attr in ("width", "height", "r", "stroke-width"):
-                    e.attributes[attr] = SVG.length_to_pixels(val)
+                    e.attributes[attr] = SVG.parse_length(val)
 
-            shapes.append(e)
-        return SVG(shapes)
+            transform = transforms[-1] if transforms else IDENTITY_TRANSFORM
+            if 'transform' in e.attributes:
+                transform = multiply_transforms(transform, SVG.parse_transform(e.attributes.pop('transform')))
+            SVG.transform_shape(e, transform)
+            yield e
 
-class SimpleXMLReader:
-    ReadingStage = {
-        "BEFORE_TAG":       0, # Looking for < (-> reading tag)
-        "READING_TAG":      1, # Looking for space (-> before attr) or > (-> finish tag)
-        "BEFORE_ATTR":      2, # Looking for _ or letter (-> reading attr) or > (-> finish tag)
-        "READING_ATTR":     3, # Looking for space (-> finish attr) or = (-> before val) or > (-> finish tag)
-        "FINISHED_ATTR":    4, # Looking for _ or letter (-> reading attr) or = (-> before val) or > (-> finish tag)
-        "BEFORE_VAL":       5, # Looking for " or ' (-> reading val)
-        "READING_VAL":      6  # Looking for matching " or ' (-> before attr)
-    }
+    # Apply an affine transform to a shape's geometry and round it to pixels. Shapes that stay
+    # axis-aligned keep their type; rects, circles and ellipses that are rotated or skewed become
+    # paths. Paths, polygons and polylines are turned into a list of (points, closed).
+    @staticmethod
+    def transform_shape(e, transform):
+        attrs = e.attributes
+        a, b, c, d, tx, ty = transform
+        # Curves are flattened before the transform, so the tolerance is scaled to match
+        scale = max(math.sqrt(a * a + b * b), math.sqrt(c * c + d * d))
+        tolerance = SVG.PathTolerance / scale if scale > 0 else SVG.PathTolerance
+        if 'stroke-width' in attrs:
+            attrs['stroke-width'] = max(1, round(attrs['stroke-width'] * math.sqrt(abs(a * d - b * c))))
+        name = e.name
+        aligned = b == 0 and c == 0
+
+        if name == "line":
+            x1, y1 = attrs.get('x1', 0), attrs.get('y1', 0)
+            x2, y2 = attrs.get('x2', 0), attrs.get('y2', 0)
+            attrs['x1'] = round(a * x1 + c * y1 + tx)
+            attrs['y1'] = round(b * x1 + d * y1 + ty)
+            attrs['x2'] = round(a * x2 + c * y2 + tx)
+            attrs['y2'] = round(b * x2 + d * y2 + ty)
+            return
+        if name == "rect":
+            x, y = attrs.get('x', 0), attrs.get('y', 0)
+            w, h = attrs.get('width', 0), attrs.get('height', 0)
+            if aligned:
+                # Round the edges rather than the size, so neighbouring rects still meet
+                x0, x1 = sorted((round(a * x + tx), round(a * (x + w) + tx)))
+                y0, y1 = sorted((round(d * y + ty), round(d * (y + h) + ty)))
+                attrs['x'], attrs['y'], attrs['width'], attrs['height'] = x0, y0, x1 - x0, y1 - y0
+                return
+            subpaths = [([x, y, x + w, y, x + w, y + h, x, y + h], True)]
+        elif name == "circle" or name == "ellipse":
+            cx, cy = attrs.get('cx', 0), attrs.get('cy', 0)
+            rx = attrs.get('rx', 0) if name == "ellipse" else attrs.get('r', 0)
+            ry = attrs.get('ry', 0) if name == "ellipse" else rx
+            if aligned:
+                rx, ry = round(rx * abs(a)), round(ry * abs(d))
+                attrs['cx'], attrs['cy'] = round(a * cx + tx), round(d * cy + ty)
+                if name == "circle" and rx != ry:
+                    e.name = "ellipse"
+                if e.name == "ellipse":
+                    attrs['rx'], attrs['ry'] = rx, ry
+                else:
+                    attrs['r'] = rx
+                return
+            points = [cx + rx, cy]
+            flatten_arc(points, cx + rx, cy, rx, ry, 0, False, True, cx - rx, cy, tolerance)
+            flatten_arc(points, cx - rx, cy, rx, ry, 0, False, True, cx + rx, cy, tolerance)
+            subpaths = [(points[0:-2], True)]
+        elif name == "path":
+            subpaths = SVG.parse_path(attrs.get('d', ""), tolerance)
+        else:
+            points = [v for v in PathData(attrs.get('points', "")).numbers()]
+            subpaths = [(points[0:len(points) & ~1], name == "polygon")]
+
+        if transform != IDENTITY_TRANSFORM:
+            for points, _ in subpaths:
+                transform_points(transform, points)
+        if name == "polygon" or name == "polyline":
+            attrs['points'] = subpaths
+        else:
+            e.name = "path"
+            attrs['d'] = subpaths
+
+    # Transform from the viewBox of an svg element to its viewport, which is width by height
+    # pixels if given, otherwise the element's width and height or the size of the viewBox
+    @staticmethod
+    def viewport_transform(attrs, width=None, height=None):
+        view_box = attrs.get('viewbox')
+        if type(view_box) is not str:
+            return IDENTITY_TRANSFORM
+        vx, vy, vw, vh = (list(PathData(view_box).numbers()) + [0, 0, 0, 0])[0:4]
+        if vw <= 0 or vh <= 0:
+            return IDENTITY_TRANSFORM
+        if width is None:
+            width = attrs.get('width')
+            width = SVG.parse_length(width) if type(width) is str and not width.endswith('%') else vw
+        if height is None:
+            height = attrs.get('height')
+            height = SVG.parse_length(height) if type(height) is str and not height.endswith('%') else vh
+        sx = width / vw
+        sy = height / vh
+
+        aspect = attrs.get('preserveaspectratio')
+        parts = aspect.lower().split() if type(aspect) is str else []
+        if parts and parts[0] == "defer":
+            parts = parts[1:]
+        align = parts[0] if parts else "xmidymid"
+        if align == "none":
+            return (sx, 0.0, 0.0, sy, -vx * sx, -vy * sy)
+        s = max(sx, sy) if len(parts) > 1 and parts[1] == "slice" else min(sx, sy)
+        # Share the space left over by the uniform scale according to the alignment
+        ax = 0 if "xmin" in align else 1 if "xmax" in align else 0.5
+        ay = 0 if "ymin" in align else 1 if "ymax" in align else 0.5
+        return (s, 0.0, 0.0, s, (width - vw * s) * ax - vx * s, (height - vh * s) * ay - vy * s)
+
+    # Parse a transform attribute such as "translate(10 5) rotate(45)" into one affine transform
+    # (a, b, c, d, e, f), which maps x, y to a * x + c * y + e, b * x + d * y + f
+    @staticmethod
+    def parse_transform(text):
+        transform = IDENTITY_TRANSFORM
+        for part in text.split(")"):
+            if "(" not in part:
+                continue
+            name, args = part.split("(", 1)
+            name = name.strip(" ,\t\r\n").lower()
+            args = list(PathData(args).numbers())
+            if name == "matrix" and len(args) == 6:
+                t = tuple(args)
+            elif name == "translate" and args:
+                t = (1.0, 0.0, 0.0, 1.0, args[0], args[1] if len(args) > 1 else 0.0)
+            elif name == "scale" and args:
+                t = (args[0], 0.0, 0.0, args[1] if len(args) > 1 else args[0], 0.0, 0.0)
+            elif name == "rotate" and args:
+                angle = math.radians(args[0])
+                cos_a = math.cos(angle)
+                sin_a = math.sin(angle)
+                # Rotating about cx, cy is translate(cx, cy) rotate translate(-cx, -cy)
+                cx, cy = (args[1], args[2]) if len(args) > 2 else (0.0, 0.0)
+                t = (cos_a, sin_a, -sin_a, cos_a, cx - cos_a * cx + sin_a * cy, cy - sin_a * cx - cos_a * cy)
+            elif name == "skewx" and args:
+                t = (1.0, 0.0, math.tan(math.radians(args[0])), 1.0, 0.0, 0.0)
+            elif name == "skewy" and args:
+                t = (1.0, math.tan(math.radians(args[0])), 0.0, 1.0, 0.0, 0.0)
+            else:
+                raise ValueError(f"Unsupported SVG transform: '{part.strip()})'")
+            transform = multiply_transforms(transform, t)
+        return transform
+
+    # Flatten path data (a d attribute) to a list of (points, closed), with points as
+    # [x0, y0, x1, y1, ...]. Curves and arcs are split until each piece is within tolerance pixels
+    # of the curve, so small shapes get few segments.
+    @staticmethod
+    def parse_path(d, tolerance=None):
+        if tolerance is None:
+            tolerance = SVG.PathTolerance
+        data = PathData(d)
+        subpaths = []
+        points = []
+        x = y = 0.0
+        start_x = start_y = 0.0
+        # Second control point of the last C/S and control point of the last Q/T, for S and T
+        cubic_x = cubic_y = None
+        quad_x = quad_y = None
+        cmd = None
+        while True:
+            next_cmd = data.command()
+            if next_cmd is None:
+                if cmd is None or not data.has_number():
+                    break
+                # Repeated arguments repeat the command, and after a move they are lines
+                if cmd == "M":
+                    cmd = "L"
+                elif cmd == "m":
+                    cmd = "l"
+            else:
+                cmd = next_cmd
+            upper = cmd.upper()
+            relative = cmd != upper
+            last_cubic = (cubic_x, cubic_y)
+            last_quad = (quad_x, quad_y)
+            cubic_x = cubic_y = quad_x = quad_y = None
+
+            if upper == "Z":
+                if len(points) >= 4:
+                    subpaths.append((points, True))
+                points = []
+                x, y = start_x, start_y
+                cmd = None
+                continue
+            if upper == "M":
+                if len(points) >= 4:
+                    subpaths.append((points, False))
+                x, y = data.point(x, y, relative)
+                start_x, start_y = x, y
+                points = [x, y]
+                continue
+            if not points:
+                # Drawing on after a Z starts a new subpath where the last one started
+                points = [x, y]
+
+            if upper == "L":
+                x, y = data.point(x, y, relative)
+            elif upper == "H":
+                x = data.number() + (x if relative else 0)
+            elif upper == "V":
+                y = data.number() + (y if relative else 0)
+            elif upper == "C" or upper == "S":
+                if upper == "C":
+                    x1, y1 = data.point(x, y, relative)
+                elif last_cubic[0] is not None:
+                    x1, y1 = 2 * x - last_cubic[0], 2 * y - last_cubic[1]
+                else:
+                    x1, y1 = x, y
+                x2, y2 = data.point(x, y, relative)
+                x3, y3 = data.point(x, y, relative)
+                flatten_cubic(points, x, y, x1, y1, x2, y2, x3, y3, tolerance)
+                cubic_x, cubic_y = x2, y2
+                x, y = x3, y3
+            elif upper == "Q" or upper == "T":
+                if upper == "Q":
+                    qx, qy = data.point(x, y, relative)
+                elif last_quad[0] is not None:
+                    qx, qy = 2 * x - last_quad[0], 2 * y - last_quad[1]
+                else:
+                    qx, qy = x, y
+                x3, y3 = data.point(x, y, relative)
+                # As the equivalent cubic
+                flatten_cubic(points, x, y, x + 2 * (qx - x) / 3, y + 2 * (qy - y) / 3,
+                              x3 + 2 * (qx - x3) / 3, y3 + 2 * (qy - y3) / 3, x3, y3, tolerance)
+                quad_x, quad_y = qx, qy
+                x, y = x3, y3
+            elif upper == "A":
+                rx = abs(data.number())
+                ry = abs(data.number())
+                rotation = data.number()
+                large_arc = data.flag()
+                sweep = data.flag()
+                x3, y3 = data.point(x, y, relative)
+                flatten_arc(points, x, y, rx, ry, rotation, large_arc, sweep, x3, y3, tolerance)
+                x, y = x3, y3
+            else:
+                raise ValueError(f"Unsupported path command: '{cmd}'")
+            if upper != "C" and upper != "S" and upper != "Q" and upper != "T" and upper != "A":
+                points.append(x)
+                points.append(y)
+        if len(points) >= 4:
+            subpaths.append((points, False))
+        return subpaths
+
+IDENTITY_TRANSFORM = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+# The affine transform that applies n and then m
+def multiply_transforms(m, n):
+    return (
+        m[0] * n[0] + m[2] * n[1],
+        m[1] * n[0] + m[3] * n[1],
+        m[0] * n[2] + m[2] * n[3],
+        m[1] * n[2] + m[3] * n[3],
+        m[0] * n[4] + m[2] * n[5] + m[4],
+        m[1] * n[4] + m[3] * n[5] + m[5]
+    )
+
+# Transform points, as [x0, y0, x1, y1, ...], in place
+def transform_points(transform, points):
+    a, b, c, d, tx, ty = transform
+    for i in range(0, len(points) - 1, 2):
+        x = points[i]
+        y = points[i + 1]
+        points[i] = a * x + c * y + tx
+        points[i + 1] = b * x + d * y + ty
+
+# Reads the commands and numbers of path data in turn
+class PathData:
+    def __init__(self, d):
+        self.d = d
+        self.pos = 0
+
+    def _skip_separators(self):
+        d = self.d
+        pos = self.pos
+        while pos < len(d) and (d[pos].isspace() or d[pos] == ","):
+            pos += 1
+        self.pos = pos
+
+    # The next command letter, or None if the next thing isn't one
+    def command(self):
+        self._skip_separators()
+        if self.pos < len(self.d) and self.d[self.pos].isalpha():
+            self.pos += 1
+            return self.d[self.pos - 1]
+        return None
 
-    def __init__(self):
-        self._elements = []
-        self._tag = ""
-        self._attrs = dict()
-        self._attr_name = ""
-        self._attr_value = True
-        self._val_quote_type = ""
-        self._stage = self.ReadingStage["BEFORE_TAG"]
-
-    def _finish_element(self):
-        if self._tag[0] is "_" or self._tag[0].isalpha():
-            self._elements.append(Element(self._tag.lower(), self._attrs))
-        self._tag = ""
-        self._attrs = dict()
-        self._stage = self.ReadingStage["BEFORE_TAG"]
-
-    def _finish_attr(self):
-        self._attrs[self._attr_name.lower()] = self._attr_value
-        self._attr_name = ""
-        self._attr_value = True
-
-    def _goto_reading_tag(self):
-        self._tag = ""
-        self._stage = self.ReadingStage["READING_TAG"]
-
-    def _goto_before_attr(self):
-        self._stage = self.ReadingStage["BEFORE_ATTR"]
-
-    def _goto_reading_attr(self, first_char):
-        self._attr_name = first_char
-        self._stage = self.ReadingStage["READING_ATTR"]
-
-    def _goto_finished_attr(self):
-        self._stage = self.ReadingStage["FINISHED_ATTR"]
-
-    def _goto_before_val(self):
-        self._val_quote_type = ""
-        self._stage = self.ReadingStage["BEFORE_VAL"]
-
-    def _goto_reading_val(self, quote_type):
-        self._val_quote_type = quote_type
-        self._attr_value = ""
-        self._stage = self.ReadingStage["READING_VAL"]
+    def has_number(self):
+        self._skip_separators()
+        return self.pos < len(self.d) and self.d[self.pos] in "+-.0123456789"
+
+    def number(self):
+        self._skip_separators()
+        d = self.d
+        start = pos = self.pos
+        if pos < len(d) and d[pos] in "+-":
+            pos += 1
+        seen_dot = False
+        while pos < len(d) and (d[pos].isdigit() or (d[pos] == "." and not seen_dot)):
+            seen_dot = seen_dot or d[pos] == "."
+            pos += 1
+        if pos < len(d) and d[pos] in "eE":
+            exp = pos + 1
+            if exp < len(d) and d[exp] in "+-":
+                exp += 1
+            if exp < len(d) and d[exp].isdigit():
+                pos = exp
+                while pos < len(d) and d[pos].isdigit():
+                    pos += 1
+        if pos == start:
+            raise ValueError(f"Expected a number in path data at {start}")
+        self.pos = pos
+        return float(d[start:pos])
+
+    # Arc flags are a single 0 or 1 and may be written without a separator
+    def flag(self):
+        self._skip_separators()
+        if self.pos >= len(self.d) or self.d[self.pos] not in "01":
+            raise ValueError(f"Expected a flag in path data at {self.pos}")
+        self.pos += 1
+        return self.d[self.pos - 1] == "1"
+
+    # The next coordinate pair, made absolute from x, y if relative
+    def point(self, x, y, relative):
+        px = self.number()
+        py = self.number()
+        if relative:
+            return px + x, py + y
+        return px, py
+
+    def numbers(self):
+        while self.has_number():
+            yield self.number()
+
+# Append points along the cubic Bezier from x0, y0 to x3, y3 (not including its start) to points,
+# splitting it in half until the control points are within tolerance of the chord
+def flatten_cubic(points, x0, y0, x1, y1, x2, y2, x3, y3, tolerance, depth=0):
+    dx = x3 - x0
+    dy = y3 - y0
+    d1 = abs((x1 - x3) * dy - (y1 - y3) * dx)
+    d2 = abs((x2 - x3) * dy - (y2 - y3) * dx)
+    chord = dx * dx + dy * dy
+    if chord > 1e-6:
+        flat = (d1 + d2) * (d1 + d2) <= tolerance * tolerance * chord
+    else:
+        # The ends meet, measure how far the control points are from them instead
+        flat = max(abs(x1 - x0), abs(y1 - y0), abs(x2 - x0), abs(y2 - y0)) <= tolerance
+    if flat or depth >= 10:
+        points.append(x3)
+        points.append(y3)
+        return
+    # de Casteljau split at t = 0.5
+    x01 = (x0 + x1) / 2
+    y01 = (y0 + y1) / 2
+    x12 = (x1 + x2) / 2
+    y12 = (y1 + y2) / 2
+    x23 = (x2 + x3) / 2
+    y23 = (y2 + y3) / 2
+    xa = (x01 + x12) / 2
+    ya = (y01 + y12) / 2
+    xb = (x12 + x23) / 2
+    yb = (y12 + y23) / 2
+    xm = (xa + xb) / 2
+    ym = (ya + yb) / 2
+    flatten_cubic(points, x0, y0, x01, y01, xa, ya, xm, ym, tolerance, depth + 1)
+    flatten_cubic(points, xm, ym, xb, yb, x23, y23, x3, y3, tolerance, depth + 1)
+
+# Append points along an SVG elliptical arc (endpoint parameterization) to points, not including its
+# start, with enough segments that each is within tolerance of the arc
+def flatten_arc(points, x0, y0, rx, ry, rotation, large_arc, sweep, x, y, tolerance):
+    if rx == 0 or ry == 0 or (x0 == x and y0 == y):
+        points.append(x)
+        points.append(y)
+        return
+    # Centre parameterization, following the SVG implementation notes
+    phi = math.radians(rotation)
+    cos_phi = math.cos(phi)
+    sin_phi = math.sin(phi)
+    hx = (x0 - x) / 2
+    hy = (y0 - y) / 2
+    x1 = cos_phi * hx + sin_phi * hy
+    y1 = -sin_phi * hx + cos_phi * hy
+    # Scale up radii that are too small to reach
+    scale = (x1 * x1) / (rx * rx) + (y1 * y1) / (ry * ry)
+    if scale > 1:
+        scale = math.sqrt(scale)
+        rx *= scale
+        ry *= scale
+    num = rx * rx * ry * ry - rx * rx * y1 * y1 - ry * ry * x1 * x1
+    den = rx * rx * y1 * y1 + ry * ry * x1 * x1
+    factor = math.sqrt(max(0, num / den))
+    if large_arc == sweep:
+        factor = -factor
+    cx1 = factor * rx * y1 / ry
+    cy1 = -factor * ry * x1 / rx
+    cx = cos_phi * cx1 - sin_phi * cy1 + (x0 + x) / 2
+    cy = sin_phi * cx1 + cos_phi * cy1 + (y0 + y) / 2
+    start = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    delta = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx) - start
+    if sweep and delta < 0:
+        delta += 2 * math.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * math.pi
+    # Largest angle per segment that keeps the chord within tolerance of the larger radius
+    r = max(rx, ry)
+    step = 2 * math.acos(max(-1, 1 - tolerance / r)) if tolerance < r else math.pi / 2
+    segments = max(1, int(math.ceil(abs(delta) / step)))
+    for i in range(1, segments):
+        t = start + delta * i / segments
+        ex = rx * math.cos(t)
+        ey = ry * math.sin(t)
+        points.append(cos_phi * ex - sin_phi * ey + cx)
+        points.append(sin_phi * ex + cos_phi * ey + cy)
+    # End exactly on the end point
+    points.append(x)
+    points.append(y)
+
+# Minimal XML reader that only extracts elements and their attributes; text, comments and
+# declarations are skipped, and so are closing tags unless end_tags is set, when they are yielded as
+# elements named "/" and the tag name with no attributes. The stream is read chunk_size characters
+# at a time and names and values are sliced out of the buffer rather than built up a character at a
+# time.
+class SimpleXMLReader:
+    def __init__(self, chunk_size=256, end_tags=False):
+        self.chunk_size = chunk_size
+        self.end_tags = end_tags
 
     def get_all_elements(self, stream):
-        self._stage = self.ReadingStage["BEFORE_TAG"]
-        self._elements = []
+        return list(self.iter_elements(stream))
+
+    # Yield the elements of a text stream one at a time, as they are read
+    def iter_elements(self, stream):
+        chunk_size = self.chunk_size
+        buf = ""
+        pos = 0
+        eof = False
+        while True:
+            start = buf.find("<", pos)
+            if start < 0:
+                # Nothing left in the buffer but text
+                buf = stream.read(chunk_size)
+                pos = 0
+                if not buf:
+                    return
+                continue
+            end = self._tag_end(buf, start)
+            if end < 0:
+                # The tag runs past the end of the buffer, keep it and read more
+                if eof:
+                    return
+                chunk = stream.read(chunk_size)
+                eof = not chunk
+                buf = buf[start:] + chunk
+                pos = 0
+                continue
+            if buf.startswith("</", start):
+                element = Element("/" + buf[start + 2:end].strip().lower(), {}) if self.end_tags else None
+            else:
+                element = self._parse_tag(buf, start + 1, end)
+            pos = end + 1
+            if element is not None:
+                yield element
+
+    # Position of the > closing the tag starting at start, skipping any > in quoted values and
+    # taking comments to their -->. -1 if the buffer doesn't hold the whole tag.
+    @staticmethod
+    def _tag_end(buf, start):
+        if buf.startswith("<!--", start):
+            end = buf.find("-->", start + 4)
+            return end + 2 if end >= 0 else -1
+        i = start + 1
         while True:
-            char = stream.read(1)
-            if not char:
+            end = buf.find(">", i)
+            if end < 0:
+                return -1
+            q = buf.find('"', i, end)
+            sq = buf.find("'", i, end)
+            if q < 0 or 0 <= sq < q:
+                q = sq
+            if q < 0:
+                return end
+            close = buf.find(buf[q], q + 1)
+            if close < 0:
+                return -1
+            i = close + 1
+
+    # Element for the tag between start and end, or None if it isn't an element (closing tags,
+    # comments, declarations). Attributes without a value are True.
+    @staticmethod
+    def _parse_tag(buf, start, end):
+        i = start
+        while i < end and not buf[i].isspace():
+            i += 1
+        name = buf[start:i]
+        if name.endswith("/"):
+            name = name[:-1]
+        if not name or not (name[0] == "_" or name[0].isalpha()):
+            return None
+        attrs = dict()
+        while i < end:
+            eq = buf.find("=", i, end)
+            names = buf[i:end if eq < 0 else eq].split()
+            # Names not followed by = have no value
+            for attr_name in (names if eq < 0 else names[:-1]):
+                SimpleXMLReader._add_attr(attrs, attr_name, True)
+            if eq < 0:
                 break
-            
-            if self._stage == 0: # BEFORE_TAG
-                if char is '<':
-                    self._goto_reading_tag()
-            elif self._stage == 1: # READING_TAG
-                if char.isspace():
-                    self._goto_before_attr()
-                elif char is '>':
-                    self._finish_element()
-                else:
-                    self._tag += char
-
-            elif self._stage == 2: # BEFORE_ATTR
-                if char.isalpha() or char == '_':
-                    self._goto_reading_attr(char)
-                elif char is '>':
-                    self._finish_element()
-
-            elif self._stage == 3: # READING_ATTR
-                if char.isspace():
-                    self._goto_finished_attr()
-                elif char is '=':
-                    self._goto_before_val()
-                elif char is '>':
-                    self._finish_attr()
-                    self._finish_element()
-                else:
-                    self._attr_name += char
-
-            elif self._stage == 4: # FINISHED_ATTR
-                if char is '=':
-                    self._goto_before_val()
-                elif char.isalpha() or char == '_':
-                    self._finish_attr()
-                    self._goto_reading_attr(char)
-                elif char is '>':
-                    self._finish_attr()
-                    self._finish_element()
-                    
-            elif self._stage == 5: # BEFORE_VAL
-                if char is '"' or char is "'":
-                    self._goto_reading_val(char)
-
-            elif self._stage == 6: # READING_VAL
-                if char is self._val_quote_type:
-                    self._finish_attr()
-                    self._goto_before_attr()
-                else:
-                    self._attr_value += char
-        return self._elements
-    
+            # The value is the next quoted string
+            q = buf.find('"', eq + 1, end)
+            sq = buf.find("'", eq + 1, end)
+            if q < 0 or 0 <= sq < q:
+                q = sq
+            if q < 0:
+                if names:
+                    SimpleXMLReader._add_attr(attrs, names[-1], True)
+                break
+            close = buf.find(buf[q], q + 1, end)
+            if close < 0:
+                close = end
+            if names:
+                SimpleXMLReader._add_attr(attrs, names[-1], buf[q + 1:close])
+            i = close + 1
+        return Element(name.lower(), attrs, buf[end - 1] == "/")
+
+    # Attribute names start at the first letter or _
+    @staticmethod
+    def _add_attr(attrs, name, value):
+        i = 0
+        while i < len(name) and not (name[i].isalpha() or name[i] == "_"):
+            i += 1
+        if i < len(name):
+            attrs[name[i:].lower()] = value
+
 def int16_to_bytes(i: int):
     return bytes([(i >> 8) & 0xFF, i & 0xFF])
     
@@ -254,6 +709,15 @@ class CachedSVG:
         self._new_rect_data.extend([x, y, w, h])
         self._new_rect_num += 1
 
+    # Add a list of rects in [x, y, w, h, ...] format
+    def add_rects(self, rects, c: bytes):
+        if c != self._colour:
+            if self._new_rect_num > 0:
+                self._add_rects_to_buffer()
+            self._colour = c
+        self._new_rect_data.extend(rects)
+        self._new_rect_num += len(rects) // 4
+
     def finish_caching(self):
         self._add_rects_to_buffer()
         self.rects = array("B", self._rects_buffer)
@@ -261,32 +725,99 @@ class CachedSVG:
 
     def _add_rects_to_buffer(self):
         for i in range(0, self._new_rect_num, 255):
-            self._rects_buffer.extend([self._colour[0], self._colour[1], min(255, self._new_rect_num - i)])
-            self._rects_buffer.extend(self._new_rect_data)
+            n = min(255, self._new_rect_num - i)
+            self._rects_buffer.extend([self._colour[0], self._colour[1], n])
+            self._rects_buffer.extend(self._new_rect_data[i * 4:(i + n) * 4])
         self._new_rect_data = []
         self._new_rect_num = 0
 
-
-def create_cached_svg(self, svg):
-    cached_svg = CachedSVG()
-    self._draw_to_cache = cached_svg
-    self.draw_svg(svg)
-    cached_svg.finish_caching()
-    self._draw_to_cache = None
-    return cached_svg
-    
-def draw_cached_svg(self, cached_svg: CachedSVG, x = 0, y = 0):
-    i = 0
-    last_index = len(cached_svg.rects) - 1
-    while i < last_index:
-        c = bytes(cached_svg.rects[i:i+2])
-        num_rects = cached_svg.rects[i + 2]
-        i += 3
-        for _ in range(num_rects):
-            self.draw_rect(
-                cached_svg.rects[i] + x, 
-                cached_svg.rects[i + 1] + y, 
-                cached_svg.rects[i + 2], 
-                cached_svg.rects[i + 3],
-                c)
-            i += 4
\ No newline at end of file
+    # The colour runs as (colour, rects), rects in [x, y, w, h, ...] format
+    def runs(self):
+        rects = memoryview(self.rects)
+        i = 0
+        while i + 3 <= len(rects):
+            num_rects = rects[i + 2]
+            yield bytes(rects[i:i + 2]), rects[i + 3:i + 3 + num_rects * 4]
+            i += 3 + num_rects * 4
+
+    # Write the cached SVG to a file in the format described at CACHED_SVG_MAGIC
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(CACHED_SVG_MAGIC)
+            for c, rects in self.runs():
+                f.write(c)
+                f.write((len(rects) // 4).to_bytes(2, 'little'))
+                f.write(struct.pack("<%dh" % len(rects), *rects))
+
+    # Read a file written by save. The rects have to be on screen (0-255) to be held in RAM; use
+    # play_cached_svg to draw other files straight from flash.
+    @staticmethod
+    def load(path):
+        cached_svg = CachedSVG()
+        with open(path, "rb") as f:
+            for c, rects in read_cached_svg_runs(f, 64):
+                for i in range(0, len(rects), 4):
+                    if not 0 <= min(rects[i:i + 4]) <= max(rects[i:i + 4]) <= 255:
+                        raise ValueError("Cached SVG rect off screen")
+                    cached_svg.add_rect(rects[i], rects[i + 1], rects[i + 2], rects[i + 3], c)
+        cached_svg.finish_caching()
+        return cached_svg
+
+# Cached SVG file format, integers little endian:
+#   magic       4 bytes, b'STSV'
+#   runs        until the end of the file, each:
+#                   colour      2 bytes, RGB565 as sent to the panel
+#                   count       2 bytes, number of rects
+#                   rects       count rects of x, y, w, h as signed 16 bit integers
+CACHED_SVG_MAGIC = const(b'STSV')
+
+# Read the runs of a cached SVG file, yielding (colour, rects) with rects as an array("h") of at
+# most chunk_rects rects. The array is reused for each chunk, so use it before reading the next.
+def read_cached_svg_runs(f, chunk_rects=32):
+    if f.read(4) != CACHED_SVG_MAGIC:
+        raise ValueError("Not a cached SVG file")
+    chunk = array("h", bytes(8 * chunk_rects))
+    chunk_ref = memoryview(chunk)
+    # The rects are read straight into a native array, so on big endian hosts they are swapped after
+    swap = sys.byteorder == "big"
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            return
+        c = header[0:2]
+        remaining = header[2] | (header[3] << 8)
+        while remaining > 0:
+            n = min(remaining, chunk_rects)
+            if f.readinto(chunk_ref[0:n * 4]) != n * 8:
+                raise ValueError("Truncated cached SVG file")
+            if swap:
+                for i in range(n * 4):
+                    v = ((chunk[i] & 0xFF) << 8) | ((chunk[i] >> 8) & 0xFF)
+                    chunk[i] = v - 0x10000 if v & 0x8000 else v
+            yield c, chunk_ref[0:n * 4]
+            remaining -= n
+
+# Draw a cached SVG file on tft with its origin at x, y, reading it chunk_rects rects at a time so
+# only one chunk is in RAM. Rects are clipped to the screen.
+def play_cached_svg(path, tft, x=0, y=0, chunk_rects=32):
+    out = bytearray(4 * chunk_rects)
+    out_ref = memoryview(out)
+    width = tft.width
+    height = tft.height
+    draw_rects = tft.draw_rects
+    with open(path, "rb") as f:
+        for c, rects in read_cached_svg_runs(f, chunk_rects):
+            n = 0
+            for i in range(0, len(rects), 4):
+                left = max(rects[i] + x, 0)
+                top = max(rects[i + 1] + y, 0)
+                right = min(rects[i] + x + rects[i + 2], width)
+                bottom = min(rects[i + 1] + y + rects[i + 3], height)
+                if right > left and bottom > top:
+                    out[n] = left
+                    out[n + 1] = top
+                    out[n + 2] = right - left
+                    out[n + 3] = bottom - top
+                    n += 4
+            if n > 0:
+                draw_rects(out_ref[0:n], c)